@@ -0,0 +1,61 @@
+from django.contrib import admin
+
+from .models import CrawlJob, Overlap, ParserSpec, School, Snapshot, TimingSpan
+
+
+class TimingSpanInline(admin.TabularInline):
+    model = TimingSpan
+    fields = ('parser', 'stage', 'started_at', 'duration', 'profile')
+    readonly_fields = fields
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(CrawlJob)
+class CrawlJobAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'status', 'attempt', 'duration', 'inserted', 'updated', 'unchanged', 'deleted')
+    list_filter = ('status',)
+    readonly_fields = ('status', 'created_at', 'started_at', 'finished_at', 'inserted', 'updated', 'unchanged',
+                       'deleted', 'error', 'parsers', 'attempt', 'run_after')
+    inlines = [TimingSpanInline]
+
+    def duration(self, obj):
+        if obj.started_at and obj.finished_at:
+            return f'{(obj.finished_at - obj.started_at).total_seconds():.1f} с'
+        return '-'
+
+    duration.short_description = 'Длительность'
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(TimingSpan)
+class TimingSpanAdmin(admin.ModelAdmin):
+    list_display = ('job', 'parser', 'stage', 'started_at', 'duration')
+    list_filter = ('stage', 'parser')
+
+
+@admin.register(ParserSpec)
+class ParserSpecAdmin(admin.ModelAdmin):
+    list_display = ('name', 'school', 'campaign', 'layout', 'is_active')
+    list_filter = ('campaign', 'school', 'is_active')
+
+
+@admin.register(Snapshot)
+class SnapshotAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'school', 'total', 'bvi', 'funded_only', 'joined', 'withdrawn')
+    list_filter = ('school',)
+    exclude = ('student_ids',)
+
+
+@admin.register(Overlap)
+class OverlapAdmin(admin.ModelAdmin):
+    list_display = ('normalized_name', 'school_count', 'created_at')
+    search_fields = ('normalized_name',)
+
+
+admin.site.register(School)
@@ -0,0 +1,228 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+logger = logging.getLogger(__name__)
+
+
+def with_fallback(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.connection is None:
+            return getattr(caches[self.fallback], method.__name__)(*args, **kwargs)
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error))
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache in a local SQLite file, shared by all processes that can reach it.
+
+    Entries expire by timeout; when MAX_ENTRIES is exceeded, expired entries
+    and then the least recently used ones are evicted. Reads record their
+    access time at most once per OPTIONS['ACCESS_INTERVAL'] seconds, so a
+    hit rarely takes the write lock.
+
+    If the file can't be opened, this process uses the cache alias named in
+    OPTIONS['FALLBACK'] from then on, so the two caches never both hold a
+    key. A locked or busy file is not a reason to fall back: the error is
+    raised after the connection's busy timeout.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.fallback = options.get('FALLBACK')
+        self.access_interval = options.get('ACCESS_INTERVAL', 60)
+        self._fallen_back = False
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        if self._fallen_back:
+            return None
+
+        # Connections can't be shared with forked uWSGI workers or other threads.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            try:
+                self._local.connection = self.connect()
+            except (sqlite3.Error, OSError) as e:
+                if not self.fallback or is_busy(e):
+                    raise
+                logger.exception(f'Cache file {self.location} is not usable, falling back to "{self.fallback}".')
+                self._fallen_back = True
+                return None
+            self._local.pid = os.getpid()
+
+        return self._local.connection
+
+    def connect(self):
+        directory = os.path.dirname(self.location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = sqlite3.connect(self.location, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL, accessed REAL NOT NULL)'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+        return connection
+
+    @with_fallback
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+
+        with self.transaction() as connection:
+            connection.execute('DELETE FROM cache WHERE key = ? AND expires <= ?', (key, now))
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?)',
+                (key, self.dumps(value), self.get_backend_timeout(timeout), now)
+            ).rowcount
+            self.cull(connection, now)
+
+        return bool(added)
+
+    @with_fallback
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        row = self.connection.execute(
+            'SELECT value, accessed FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, now)
+        ).fetchone()
+
+        if row is None:
+            return default
+
+        value, accessed = row
+        if now - accessed >= self.access_interval:
+            self.connection.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(value)
+
+    @with_fallback
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+
+        with self.transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                (key, self.dumps(value), self.get_backend_timeout(timeout), now)
+            )
+            self.cull(connection, now)
+
+    @with_fallback
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        touched = self.connection.execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now)
+        ).rowcount
+        return bool(touched)
+
+    @with_fallback
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(self.connection.execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount)
+
+    @with_fallback
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self.connection.execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    @with_fallback
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+
+        with self.transaction() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, now)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ?, accessed = ? WHERE key = ?', (self.dumps(value), now, key)
+            )
+
+        return value
+
+    @with_fallback
+    def clear(self):
+        self.connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # The connection is kept open between requests on purpose.
+        pass
+
+    def transaction(self):
+        return Transaction(self.connection)
+
+    def cull(self, connection, now):
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+
+        connection.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            (count // self._cull_frequency,)
+        )
+
+    def dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+
+class Transaction:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.connection.execute('COMMIT')
+        else:
+            self.connection.execute('ROLLBACK')
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import threading
+
+import aiohttp
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+formatter = logging.Formatter(
+    '%(asctime)s - %(process)d - %(name)s - %(funcName)s - %(message)s', datefmt='[%H:%M:%S]'
+)
+h = logging.StreamHandler()
+h.setFormatter(formatter)
+logger.addHandler(h)
+
+_http_client = None
+
+
+class HttpClient:
+    """
+    aiohttp session that lives as long as the process.
+
+    A session is bound to its event loop, so the client runs its own loop in
+    a background thread and every crawl and sources check is run on it. Kept
+    alive connections and resolved addresses are reused between them.
+    """
+
+    def __init__(self, limit, limit_per_host, dns_cache_ttl, keepalive_timeout, timeout):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self._loop = None
+        self._thread = None
+        self._session = None
+
+    @property
+    def started(self):
+        return self._session is not None
+
+    @property
+    def session(self):
+        if not self.started:
+            self.start()
+        return self._session
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='http-client', daemon=True)
+        self._thread.start()
+        self._session = self._submit(self._create_session()).result()
+        logger.debug(f'HTTP client started, {self.limit_per_host} connections per host.')
+
+    async def _create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    def run(self, coroutine):
+        if not self.started:
+            self.start()
+        return self._submit(coroutine).result()
+
+    def _submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def close(self):
+        if not self.started:
+            return
+
+        self._submit(self._session.close()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._session = None
+
+
+def get_http_client():
+    global _http_client
+
+    if _http_client is None:
+        _http_client = HttpClient(
+            settings.HTTP_CONNECTIONS,
+            settings.HTTP_CONNECTIONS_PER_HOST,
+            settings.HTTP_DNS_CACHE_TTL,
+            settings.HTTP_KEEPALIVE_TIMEOUT,
+            settings.HTTP_TIMEOUT,
+        )
+
+    return _http_client
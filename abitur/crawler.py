@@ -1,10 +1,15 @@
 import asyncio
 import logging
-import os
-from concurrent import futures
+import random
+from collections import namedtuple
 
-import aiohttp
+from aiohttp import ClientError
 from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .client import get_http_client
+from .pool import get_worker_pool
+from .utils import get_source_state, save_source_state
 
 
 logger = logging.getLogger(__name__)
@@ -16,59 +21,110 @@ h = logging.StreamHandler()
 h.setFormatter(formatter)
 logger.addHandler(h)
 
+CrawlResult = namedtuple('CrawlResult', 'parsers failed')
 
-class AsyncCrawler:
 
-    def __init__(self, *parsers):
-        self.parsers = []
+def backoff_delay(attempt, base):
+    # Exponential backoff with jitter, so that retries of several sources don't arrive together.
+    return base * 2 ** attempt * random.uniform(0.5, 1)
 
-        for parser in parsers:
-            self.parsers.append(parser())
 
-        self._timeout = aiohttp.ClientTimeout(total=30)
+class AsyncCrawler:
+
+    def __init__(self, *parsers, force=False):
+        self.parsers = list(parsers)
+        self.force = force
+        self.client = get_http_client()
 
-    async def _get_sources(self):
-        logger.debug('Getting sources.')
+    async def _check_all(self, session):
+        logger.debug('Checking sources.')
         tasks = []
+        semaphore = asyncio.Semaphore(settings.CRAWL_CONCURRENCY)
 
-        async with aiohttp.ClientSession(timeout=self._timeout) as session:
-            for parser in self.parsers:
-                task = asyncio.create_task(self._get_source(session, parser))
-                tasks.append(task)
-                logger.debug(f'Task with name {task.get_name()} added')
-                result = await asyncio.gather(*tasks)
+        for parser in self.parsers:
+            task = asyncio.create_task(self.limit(semaphore, self.retry(parser, self._check_source, session, parser)),
+                                       name=f'{parser.name} check')
+            tasks.append(task)
+            logger.debug(f'Task with name {task.get_name()} added')
 
-        logger.debug('Sources fetched.')
+        result = await asyncio.gather(*tasks)
+        logger.debug('Sources checked.')
 
         return result
 
-    async def _get_source(self, session, parser):
+    async def _check_source(self, session, parser):
         await parser.get_page(session)
         await sync_to_async(parser.get_source)()
-        logger.debug('Got source')
+        source = await get_source_state(parser)
+        with parser.timings.span('check_source'):
+            await parser.check_file(session, source)
+        await save_source_state(source)
+        parser.content_hash = source.content_hash
+        logger.debug(f'Source {source.url} changed: {source.changed}')
+
+        return source
+
+    @staticmethod
+    async def limit(semaphore, coroutine):
+        async with semaphore:
+            return await coroutine
+
+    async def retry(self, parser, func, *args):
+        """Run func with a timeout, retrying network errors and timeouts with backoff."""
+        name = parser.name
 
-        return parser.source_url
+        for attempt in range(settings.CRAWL_RETRIES + 1):
+            try:
+                return await asyncio.wait_for(func(*args), settings.CRAWL_SOURCE_TIMEOUT)
+            except (ClientError, asyncio.TimeoutError) as e:
+                if attempt == settings.CRAWL_RETRIES:
+                    raise
 
-    async def _crawl(self):
+                delay = backoff_delay(attempt, settings.CRAWL_RETRY_BACKOFF)
+                logger.debug(f'{name} attempt {attempt + 1} failed: {e!r}, retrying in {delay:.1f}s.')
+                await asyncio.sleep(delay)
+
+    async def _crawl_source(self, session, executor, parser):
+        source = await self.retry(parser, self._check_source, session, parser)
+
+        if not (self.force or source.changed):
+            logger.debug(f'{parser.name} skipped, source is not changed.')
+            return None
+
+        return await self.retry(parser, parser.run, session, executor)
+
+    async def _crawl(self, session):
         logger.debug('Crawler is running')
 
         tasks = []
+        executor = get_worker_pool()
 
-        async with aiohttp.ClientSession(timeout=self._timeout) as session:
-            with futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
-                for parser in self.parsers:
-                    task = asyncio.create_task(parser.run(session, executor),
-                                               name=f'{parser.__class__.__name__} task')
-                    tasks.append(task)
-                    logger.debug(f'Task with name {task.get_name()} added')
+        semaphore = asyncio.Semaphore(settings.CRAWL_CONCURRENCY)
 
-                result = await asyncio.gather(*tasks)
+        for parser in self.parsers:
+            task = asyncio.create_task(self.limit(semaphore, self._crawl_source(session, executor, parser)),
+                                       name=f'{parser.name} task')
+            tasks.append(task)
+            logger.debug(f'Task with name {task.get_name()} added')
 
-        logger.debug('Crawler finished')
-        return result
+        # One failed source must not discard the work done for the others.
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        parsers = []
+        failed = {}
+
+        for parser, result in zip(self.parsers, results):
+            if isinstance(result, Exception):
+                logger.debug(f'{parser.name} failed: {result!r}')
+                failed[parser.name] = result
+            elif result is not None:
+                parsers.append(result)
+
+        logger.debug(f'Crawler finished, {len(parsers)} sources parsed, {len(failed)} failed')
+        return CrawlResult(parsers, failed)
 
     def crawl(self):
-        return asyncio.run(self._crawl())
+        get_worker_pool().recycle()
+        return self.client.run(self._crawl(self.client.session))
 
-    def get_sources(self):
-        return asyncio.run(self._get_sources())
\ No newline at end of file
+    def check_sources(self):
+        return self.client.run(self._check_all(self.client.session))
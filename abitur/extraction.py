@@ -0,0 +1,237 @@
+from hashlib import sha256
+
+from camelot import read_pdf
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LAParams, LTCurve, LTTextLineHorizontal, LTContainer
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import resolve1
+
+
+backend_registry = {}
+
+
+def register(backend_class):
+    backend_registry[backend_class.name] = backend_class()
+    return backend_class
+
+
+def get_backend(name):
+    return backend_registry[name]
+
+
+class Backend:
+    name = ''
+
+    def extract(self, path, pages):
+        raise NotImplementedError("Each Backend subclass must implement it's own method")
+
+
+@register
+class CamelotBackend(Backend):
+    name = 'camelot'
+
+    def extract(self, path, pages):
+        return [table.data for table in read_pdf(path, pages=pages)]
+
+
+@register
+class PdfminerBackend(Backend):
+    """
+    Lattice extraction from the ruling lines drawn in the PDF itself.
+
+    Instead of rendering pages and detecting lines with OpenCV, table grids
+    are rebuilt from pdfminer's line and rectangle objects, and text lines
+    are placed into cells the way camelot's lattice flavor does.
+    """
+    name = 'pdfminer'
+    line_width = 2
+    tolerance = 2
+    laparams = LAParams(char_margin=1.0, line_margin=0.5, word_margin=0.1, detect_vertical=True, all_texts=True)
+
+    def extract(self, path, pages):
+        tables = []
+
+        for page in extract_pages(path, page_numbers=parse_pages(pages), laparams=self.laparams):
+            horizontal, vertical = self.find_lines(page)
+            text_lines = list(find_text_lines(page))
+
+            for table_horizontal, table_vertical in self.find_grids(horizontal, vertical):
+                tables.append(self.fill_grid(table_horizontal, table_vertical, text_lines))
+
+        return tables
+
+    def find_lines(self, page):
+        horizontal, vertical = [], []
+
+        for obj in page:
+            if not isinstance(obj, LTCurve):
+                continue
+
+            # Only the visible part of a line is seen by camelot's image processing.
+            x0, y0 = max(obj.x0, page.x0), max(obj.y0, page.y0)
+            x1, y1 = min(obj.x1, page.x1), min(obj.y1, page.y1)
+            if x0 > x1 or y0 > y1:
+                continue
+
+            is_horizontal = y1 - y0 <= self.line_width
+            is_vertical = x1 - x0 <= self.line_width
+
+            if is_horizontal and not is_vertical:
+                horizontal.append(((y0 + y1) / 2, x0, x1))
+            elif is_vertical and not is_horizontal:
+                vertical.append(((x0 + x1) / 2, y0, y1))
+
+        return self.merge_lines(horizontal), self.merge_lines(vertical)
+
+    def merge_lines(self, lines):
+        merged = []
+
+        for group in self.group_lines(lines):
+            position = group[0][0]
+            group.sort(key=lambda line: line[1])
+            _, start, end = group[0]
+
+            for _, next_start, next_end in group[1:]:
+                if next_start > end + self.tolerance:
+                    merged.append((position, start, end))
+                    start = next_start
+                end = max(end, next_end)
+
+            merged.append((position, start, end))
+
+        return merged
+
+    def group_lines(self, lines):
+        groups = []
+
+        for line in sorted(lines):
+            if groups and line[0] - groups[-1][-1][0] <= self.tolerance:
+                groups[-1].append(line)
+            else:
+                groups.append([line])
+
+        return groups
+
+    def find_grids(self, horizontal, vertical):
+        parents = list(range(len(horizontal) + len(vertical)))
+
+        def find(i):
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        for h_index, (y, x0, x1) in enumerate(horizontal):
+            for v_index, (x, y0, y1) in enumerate(vertical, len(horizontal)):
+                if self.crosses(x, x0, x1) and self.crosses(y, y0, y1):
+                    parents[find(h_index)] = find(v_index)
+
+        groups = {}
+        for index in range(len(parents)):
+            groups.setdefault(find(index), []).append(index)
+
+        grids = []
+        for indices in groups.values():
+            grid_horizontal = [horizontal[i] for i in indices if i < len(horizontal)]
+            grid_vertical = [vertical[i - len(horizontal)] for i in indices if i >= len(horizontal)]
+            if len(grid_horizontal) > 1 and len(grid_vertical) > 1:
+                grids.append((grid_horizontal, grid_vertical))
+
+        grids.sort(key=lambda grid: -max(y for y, _, _ in grid[0]))
+        return grids
+
+    def fill_grid(self, horizontal, vertical, text_lines):
+        rows = self.cluster(sorted((y for y, _, _ in horizontal), reverse=True))
+        columns = self.cluster(sorted(x for x, _, _ in vertical))
+        cells = [[''] * (len(columns) - 1) for _ in range(len(rows) - 1)]
+
+        for line in text_lines:
+            x = (line.x0 + line.x1) / 2
+            y = (line.y0 + line.y1) / 2
+            row = find_span(rows, y, reverse=True)
+            column = find_span(columns, x)
+
+            if row is None or column is None:
+                continue
+
+            while column > 0 and not self.has_edge(vertical, columns[column], rows[row], rows[row + 1]):
+                column -= 1
+            while row > 0 and not self.has_edge(horizontal, rows[row], columns[column], columns[column + 1]):
+                row -= 1
+
+            cells[row][column] += line.get_text()
+
+        return [[cell.strip() for cell in row] for row in cells]
+
+    def has_edge(self, lines, position, start, end):
+        middle = (start + end) / 2
+        return any(
+            abs(line_position - position) <= self.tolerance and self.crosses(middle, line_start, line_end)
+            for line_position, line_start, line_end in lines
+        )
+
+    def crosses(self, position, start, end):
+        return min(start, end) - self.tolerance <= position <= max(start, end) + self.tolerance
+
+    def cluster(self, positions):
+        clustered = []
+
+        for position in positions:
+            if not clustered or abs(position - clustered[-1]) > self.tolerance:
+                clustered.append(position)
+
+        return clustered
+
+
+def page_hashes(path):
+    """Hash of every page's drawing instructions and the fonts' character maps."""
+    hashes = []
+
+    with open(path, 'rb') as file:
+        for page in PDFPage.get_pages(file):
+            digest = sha256(repr(page.mediabox).encode())
+
+            for stream in page.contents:
+                digest.update(resolve1(stream).get_data())
+
+            fonts = resolve1(page.resources.get('Font')) or {}
+            for name in sorted(fonts):
+                font = resolve1(fonts[name])
+                digest.update(f'{name}:{font.get("BaseFont")}'.encode())
+                to_unicode = resolve1(font.get('ToUnicode'))
+                if to_unicode is not None:
+                    digest.update(to_unicode.get_data())
+
+            hashes.append(digest.hexdigest())
+
+    return hashes
+
+
+def find_text_lines(layout):
+    for obj in layout:
+        if isinstance(obj, LTTextLineHorizontal):
+            yield obj
+        elif isinstance(obj, LTContainer):
+            yield from find_text_lines(obj)
+
+
+def find_span(bounds, position, reverse=False):
+    for index in range(len(bounds) - 1):
+        low, high = bounds[index], bounds[index + 1]
+        if reverse:
+            low, high = high, low
+        if low <= position <= high:
+            return index
+    return None
+
+
+def parse_pages(pages):
+    if pages == 'all':
+        return None
+
+    page_numbers = []
+    for part in pages.split(','):
+        start, _, end = part.partition('-')
+        page_numbers.extend(range(int(start) - 1, int(end or start)))
+
+    return page_numbers
@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from abitur.models import ParserSpec
+from abitur.parsers import get_parsers, make_parser
+from abitur.pdfcache import CachedTable
+from abitur.pool import get_worker_pool
+from abitur.utils import update_records
+
+FIXTURES_DIR = os.path.join(settings.BASE_DIR, 'abitur', 'fixtures')
+
+FIXTURES = {
+    'PirogovaParser': 'pirogova_list.pdf',
+    'SechenovaParser': 'sechenova_list.pdf',
+    'SechenovaBVIParser': 'sechenova_bvi_list.pdf',
+}
+
+STAGES = ('parse_rows', 'parse', 'ingest', 'reingest')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark extraction, parsing and ingest of every parser on the recorded fixtures.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, nargs='+', default=[1, 10, 100],
+                            help='Copies of every applicant for the parse and ingest stages.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='JSON file of a previous run to compare with.')
+        # Every stage is run by the command itself in a fresh process, so its peak RSS is its own.
+        parser.add_argument('--stage', nargs=4, metavar=('PARSER', 'STAGE', 'SCALE', 'TABLES'),
+                            help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['stage']:
+            name, stage, scale, tables_path = options['stage']
+            self.stdout.write(json.dumps(run_stage(name, stage, int(scale), tables_path)))
+            return
+
+        results = []
+
+        for parser in get_parsers():
+            if parser.name not in FIXTURES:
+                self.stderr.write(f'No fixture for {parser.name}, skipped.')
+                continue
+            results.extend(self.benchmark(parser.spec, options))
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'workers': settings.CRAWLER_WORKERS,
+            'results': results,
+        }
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                self.compare(json.load(file)['results'], results)
+
+    def benchmark(self, spec, options):
+        parser = make_parser(spec)
+
+        with TemporaryDirectory() as work_dir:
+            tables_path = os.path.join(work_dir, 'tables.json')
+            results = [self.report(self.run_stage(spec.name, 'extract', 1, tables_path))]
+
+            with open(tables_path) as file:
+                tables = [CachedTable(rows) for rows in json.load(file)]
+
+            for scale in options['scale']:
+                scaled_path = os.path.join(work_dir, f'tables-{scale}.json')
+                with open(scaled_path, 'w') as file:
+                    json.dump([table.data for table in scale_tables(parser, tables, scale)], file)
+
+                for stage in STAGES:
+                    results.append(self.report(self.run_stage(spec.name, stage, scale, scaled_path)))
+
+        return results
+
+    @staticmethod
+    def run_stage(name, stage, scale, tables_path):
+        command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_parsers',
+                   '--stage', name, stage, str(scale), tables_path]
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        return json.loads(output.splitlines()[-1])
+
+    def report(self, result):
+        result['rows_per_second'] = result['rows'] / result['seconds'] if result['seconds'] else None
+        self.stdout.write(
+            f'{result["parser"]} {result["stage"]} x{result["scale"]}: {result["rows"]} rows, '
+            f'{result["seconds"]:.3f}s, {result["rows_per_second"] or 0:.0f} rows/s, '
+            f'max RSS {result["max_rss_kb"] // 1024} MB'
+        )
+        return result
+
+    def compare(self, previous, current):
+        previous = {(result['parser'], result['stage'], result['scale']): result for result in previous}
+        self.stdout.write(self.style.MIGRATE_HEADING('\nCompared with the previous run:'))
+
+        for result in current:
+            before = previous.get((result['parser'], result['stage'], result['scale']))
+            if before and before['seconds']:
+                self.stdout.write(f'{result["parser"]} {result["stage"]} x{result["scale"]}: '
+                                  f'{result["seconds"] / before["seconds"]:.2f}x the time')
+
+
+def run_stage(name, stage, scale, tables_path):
+    """Run one stage in this process and measure it; extract writes the tables the other stages read."""
+    parser = make_parser(ParserSpec.objects.select_related('school').get(name=name))
+
+    if stage == 'extract':
+        pool = get_worker_pool()
+        pool.start()
+
+        with TemporaryDirectory() as cache_dir, override_settings(PDF_CACHE_DIR=cache_dir):
+            path = os.path.join(FIXTURES_DIR, FIXTURES[name])
+            try:
+                file, seconds = measure(lambda: asyncio.run(parser.extract_file(path, pool)))
+            finally:
+                # Workers are waited for, so their peak is counted among the children's.
+                pool.shutdown()
+            tables = [table.data for table in file]
+
+        max_rss_kb = max_rss()
+        with open(tables_path, 'w') as file:
+            json.dump(tables, file)
+        parser.parse_tables(CachedTable(rows) for rows in tables)
+    else:
+        with open(tables_path) as file:
+            tables = [CachedTable(rows) for rows in json.load(file)]
+
+        if stage in ('parse_rows', 'parse'):
+            with override_settings(PARSE_VECTORIZED=stage == 'parse'):
+                _, seconds = measure(lambda: parser.parse_tables(tables))
+        else:
+            parser.parse_tables(tables)
+            # The rollback below does not reach the cache, so the data version must not be bumped.
+            try:
+                with transaction.atomic(), patch('abitur.utils.bump_data_version'):
+                    if stage == 'reingest':
+                        update_records([parser])
+                    _, seconds = measure(lambda: update_records([parser]))
+                    raise Rollback()
+            except Rollback:
+                pass
+
+        max_rss_kb = max_rss()
+
+    return {
+        'parser': name,
+        'stage': stage,
+        'scale': scale,
+        'seconds': seconds,
+        'rows': len(parser),
+        'max_rss_kb': max_rss_kb,
+    }
+
+
+def measure(func):
+    started = time.perf_counter()
+    value = func()
+    return value, time.perf_counter() - started
+
+
+def max_rss():
+    # Linux reports ru_maxrss in kilobytes.
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def scale_tables(parser, file, scale):
+    """Copy every applicant row scale times, keeping the numbering of categories intact."""
+    tables = []
+
+    for table in file:
+        name_index, _ = parser.find_columns(table)
+        rows = []
+
+        for row in table.data:
+            cells = row[0].split('\n') if '\n' in row[0] else None
+            number = (cells or row)[0].strip()
+
+            if not number.isdigit():
+                rows.append(row)
+                continue
+
+            for copy in range(scale):
+                new_row = list(cells or row)
+                new_row[0] = str((int(number) - 1) * scale + copy + 1)
+                if copy:
+                    new_row[name_index] = f'{new_row[name_index]} {copy}'
+                rows.append(['\n'.join(new_row)] if cells else new_row)
+
+        tables.append(CachedTable(rows))
+
+    return tables
@@ -0,0 +1,115 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from abitur.forms import PeriodFilterForm
+from abitur.models import Student, School, student_counts
+from abitur.utils import BATCH_SIZE, make_cursor, students_page
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time the dashboard queries on synthetic students, with and without the Student indexes. ' \
+           'Nothing is written: all changes are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Number of synthetic students.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each query.')
+        parser.add_argument('--explain', action='store_true', help='Print query plans.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.create_students(options['rows'])
+                self.run_queries(options, 'with indexes')
+
+                self.drop_indexes()
+                self.run_queries(options, 'without indexes')
+
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def create_students(self, rows):
+        schools = list(School.objects.all())
+        today = date.today()
+        rng = random.Random(0)
+        students = (
+            Student(
+                name=f'Студент {number}',
+                school=rng.choice(schools),
+                bvi=rng.random() < 0.05,
+                application_date=today - timedelta(days=rng.randrange(60)),
+                funded_only=rng.random() < 0.3,
+                is_checked=rng.random() < 0.2,
+                is_winner=rng.random() < 0.02,
+            )
+            for number in range(rows)
+        )
+
+        started = time.perf_counter()
+        Student.objects.bulk_create(students, batch_size=BATCH_SIZE)
+        self.analyze()
+        self.stdout.write(f'{rows} students created in {time.perf_counter() - started:.2f}s.')
+
+    def drop_indexes(self):
+        with connection.cursor() as cursor:
+            for index in Student._meta.indexes:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+        self.analyze()
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Student._meta.db_table}')
+
+    def get_queries(self):
+        students = Student.objects.select_related('school')
+        middle = students.order_by('-application_date', '-pk')[students.count() // 2]
+        names = list(Student.objects.values_list('name', flat=True)[:BATCH_SIZE])
+        queries = {}
+
+        for period, label in PeriodFilterForm.PERIOD_CHOICES:
+            period_filter = PeriodFilterForm({'period': period}).get_period()
+            queries[f'Первая страница: {label}'] = (
+                lambda period_filter=period_filter: students_page(students.filter(period_filter)),
+                students.filter(period_filter).order_by('-application_date', '-pk')[:100],
+            )
+
+        queries['Страница из середины'] = (
+            lambda: students_page(students, make_cursor(middle)),
+            students.filter(application_date__lte=middle.application_date).order_by('-application_date', '-pk')[:100],
+        )
+        queries['Счетчики'] = (lambda: student_counts(Student.objects.all()), None)
+        queries['Поиск при обновлении'] = (
+            lambda: list(Student.objects.filter(name__in=names).order_by().values_list('pk', 'name')),
+            Student.objects.filter(name__in=names).order_by(),
+        )
+        return queries
+
+    def run_queries(self, options, title):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n{title.capitalize()}:'))
+
+        for name, (query, queryset) in self.get_queries().items():
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                query()
+                timings.append((time.perf_counter() - started) * 1000)
+
+            self.stdout.write(f'{name}: median {statistics.median(timings):.2f} ms, min {min(timings):.2f} ms')
+
+            if options['explain'] and queryset is not None:
+                self.stdout.write(queryset.explain(**self.explain_options()))
+
+    @staticmethod
+    def explain_options():
+        if connection.vendor == 'postgresql':
+            return {'analyze': True}
+        return {}
@@ -0,0 +1,57 @@
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from abitur.client import get_http_client
+from abitur.pool import get_worker_pool
+from abitur.tasks import claim_job, fail_interrupted_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued crawl jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=2,
+                            help='Seconds to wait before polling an empty queue again.')
+        parser.add_argument('--once', action='store_true', help='Run pending jobs and exit.')
+
+    def handle(self, *args, **options):
+        interrupted = fail_interrupted_jobs()
+        if interrupted:
+            self.stdout.write(f'{interrupted} interrupted job(s) marked as failed.')
+
+        pool = get_worker_pool()
+        pool.start()
+        self.stdout.write(f'Pool of {pool.max_workers} workers started in {pool.startup_time:.2f}s.')
+
+        try:
+            self.run_jobs(options)
+        finally:
+            pool.shutdown()
+            get_http_client().close()
+
+    def run_jobs(self, options):
+        while True:
+            # A connection broken by a database restart is replaced instead of failing every later query.
+            close_old_connections()
+
+            try:
+                job = claim_job()
+
+                if job:
+                    job = run_job(job)
+                    self.stdout.write(f'Job {job.pk}: {job.status}, {job.inserted} inserted, '
+                                      f'{job.updated} updated, {job.unchanged} unchanged, {job.deleted} deleted.')
+            except Exception:
+                self.stderr.write(f'Crawl worker error:\n{traceback.format_exc()}')
+                job = None
+
+            if job:
+                continue
+
+            if options['once']:
+                break
+
+            time.sleep(options['sleep'])
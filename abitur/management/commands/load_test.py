@@ -0,0 +1,89 @@
+import asyncio
+import json
+import time
+
+import aiohttp
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+DEFAULT_PATHS = ['/abitur/', '/abitur/?period=all', '/abitur/students/?period=all', '/update/status/']
+
+
+class Command(BaseCommand):
+    help = 'Load test running deployments of the site, e.g. uWSGI against uvicorn: ' \
+           'requests per second and latency percentiles of every path.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', metavar='NAME=URL',
+                            help='Deployments to compare, e.g. wsgi=http://localhost:8000.')
+        parser.add_argument('--path', action='append', dest='paths', help='Path to request, may be repeated.')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per path and deployment.')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        results = []
+
+        for name, url in self.parse_targets(options['targets']):
+            for path in options['paths'] or DEFAULT_PATHS:
+                result = asyncio.run(self.run(url.rstrip('/') + path, options['requests'], options['concurrency']))
+                result.update(target=name, path=path)
+                results.append(self.report(result))
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'created_at': timezone.now().isoformat(), 'concurrency': options['concurrency'],
+                           'results': results}, file, indent=2)
+
+    @staticmethod
+    def parse_targets(targets):
+        if not all('=' in target for target in targets):
+            raise CommandError('Targets must look like NAME=URL.')
+        return [target.split('=', 1) for target in targets]
+
+    async def run(self, url, requests, concurrency):
+        latencies = []
+        errors = 0
+        remaining = iter(range(requests))
+
+        async def worker(session):
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    async with session.get(url, allow_redirects=False) as response:
+                        await response.read()
+                        if response.status >= 400:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+            seconds = time.perf_counter() - started
+
+        return {
+            'requests': requests,
+            'errors': errors,
+            'seconds': seconds,
+            'requests_per_second': requests / seconds,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        }
+
+    def report(self, result):
+        self.stdout.write(
+            f'{result["target"]} {result["path"]}: {result["requests_per_second"]:.1f} req/s, '
+            f'p50 {result["p50_ms"]:.1f} ms, p99 {result["p99_ms"]:.1f} ms, {result["errors"]} errors'
+        )
+        return result
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, round(percent / 100 * (len(values) - 1)))]
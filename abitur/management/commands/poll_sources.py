@@ -0,0 +1,42 @@
+import time
+import traceback
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from abitur.client import get_http_client
+from abitur.tasks import refresh_sources
+
+
+class Command(BaseCommand):
+    help = 'Periodically check university pages for new applicant lists.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=settings.SOURCES_POLL_INTERVAL,
+                            help='Seconds between checks.')
+        parser.add_argument('--once', action='store_true', help='Check once and exit.')
+
+    def handle(self, *args, **options):
+        try:
+            self.poll(options)
+        finally:
+            get_http_client().close()
+
+    def poll(self, options):
+        while True:
+            # A connection broken by a database restart is replaced instead of failing every later query.
+            close_old_connections()
+
+            try:
+                sources = refresh_sources()
+                self.stdout.write(
+                    f'{sources["checked_at"]:%H:%M:%S} ok: {sources["ok"]}, changed: {sources["changed"]}'
+                )
+            except Exception:
+                self.stderr.write(f'Sources check error:\n{traceback.format_exc()}')
+
+            if options['once']:
+                break
+
+            time.sleep(options['interval'])
@@ -0,0 +1,27 @@
+# Generated by Django 3.0.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abitur', '0003_crawljob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Source',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parser', models.CharField(max_length=100, unique=True)),
+                ('url', models.CharField(blank=True, max_length=500)),
+                ('etag', models.CharField(blank=True, max_length=200)),
+                ('last_modified', models.CharField(blank=True, max_length=100)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('ingested_hash', models.CharField(blank=True, max_length=64)),
+                ('checked_at', models.DateTimeField(blank=True, null=True)),
+                ('ingested_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
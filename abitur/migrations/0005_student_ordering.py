@@ -0,0 +1,17 @@
+# Generated by Django 3.0.7 on 2026-10-18 06:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abitur', '0004_source'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='student',
+            options={'ordering': ['-application_date', '-id']},
+        ),
+    ]
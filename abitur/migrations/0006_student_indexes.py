@@ -0,0 +1,29 @@
+# Generated by Django 3.0.7 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abitur', '0005_student_ordering'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['-application_date', '-id'], name='student_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['school', 'bvi', 'funded_only'], name='student_school_flags_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(condition=models.Q(is_winner=True), fields=['school'], name='student_winner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['name', 'school', 'application_date', 'bvi'], name='student_key_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-18 06:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abitur', '0006_student_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawljob',
+            name='deleted',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
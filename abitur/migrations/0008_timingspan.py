@@ -0,0 +1,29 @@
+# Generated by Django 3.0.7 on 2026-10-18 06:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abitur', '0007_crawljob_deleted'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimingSpan',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parser', models.CharField(blank=True, max_length=100)),
+                ('stage', models.CharField(max_length=100)),
+                ('started_at', models.DateTimeField()),
+                ('duration', models.FloatField()),
+                ('profile', models.CharField(blank=True, max_length=255)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spans', to='abitur.CrawlJob')),
+            ],
+            options={
+                'ordering': ['started_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.0.7 on 2026-10-18 06:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abitur', '0008_timingspan'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawljob',
+            name='attempt',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='crawljob',
+            name='parsers',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='crawljob',
+            name='run_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='crawljob',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершено'), ('partial', 'Частично'), ('failed', 'Ошибка')], default='pending', max_length=10),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 3.0.7 on 2026-10-18 06:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+SECHENOVA_PAGE = 'https://www.sechenov.ru/admissions/priemnaya-kampaniya-2020/' \
+                 'spiski-lits-podavshikh-dokumenty-2020-2021.php'
+
+PARSER_SPECS = [
+    dict(
+        name='PirogovaParser',
+        school='Пироговка',
+        layout='columns',
+        base_url='http://rsmu.ru/',
+        page_url='http://rsmu.ru/21087.html',
+        link_text='06.03.01 Биология',
+        name_column='Фамилия, имя, отчество',
+        date_column='Дата подачи заявления',
+        categories='bvi, special, general, contract',
+    ),
+    dict(
+        name='SechenovaParser',
+        school='Сеченовка',
+        layout='sections',
+        base_url='https://www.sechenov.ru/',
+        page_url=SECHENOVA_PAGE,
+        link_text='Бакалавриат, специалитет - список лиц подавших документы.pdf',
+        pages='1-8',
+        name_column='1',
+        date_column='2',
+        section_start='06.05.01',
+        section_end='06.05.01; особой\n19.03.01',
+        categories='contract, general',
+    ),
+    dict(
+        name='SechenovaBVIParser',
+        school='Сеченовка',
+        layout='sections',
+        base_url='https://www.sechenov.ru/',
+        page_url=SECHENOVA_PAGE,
+        link_text='Бакалавриат, специалитет - список лиц подавших документы без ВИ.pdf',
+        name_column='1',
+        date_column='2',
+        section_start='06.05.01',
+        section_end='06.05.01; особой\n19.03.01',
+        categories='general, contract',
+        bvi=True,
+    ),
+]
+
+
+def add_parser_specs(apps, schema_editor):
+    school_model = apps.get_model('abitur', 'School')
+    spec_model = apps.get_model('abitur', 'ParserSpec')
+
+    for spec in PARSER_SPECS:
+        school, _ = school_model.objects.get_or_create(name=spec['school'])
+        spec_model.objects.create(**dict(spec, school=school, campaign=2020))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abitur', '0009_crawljob_retries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParserSpec',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('campaign', models.PositiveSmallIntegerField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('layout', models.CharField(choices=[('columns', 'Таблица с заголовками'), ('sections', 'Разделы')], max_length=10)),
+                ('base_url', models.CharField(max_length=200)),
+                ('page_url', models.CharField(max_length=500)),
+                ('link_text', models.CharField(max_length=300)),
+                ('pages', models.CharField(default='all', max_length=50)),
+                ('extraction_backend', models.CharField(default='pdfminer', max_length=20)),
+                ('name_column', models.CharField(max_length=100)),
+                ('date_column', models.CharField(max_length=100)),
+                ('section_start', models.TextField(blank=True)),
+                ('section_end', models.TextField(blank=True)),
+                ('categories', models.CharField(max_length=200)),
+                ('bvi', models.BooleanField(default=False)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parser_specs', to='abitur.School')),
+            ],
+            options={
+                'ordering': ['school', 'name'],
+            },
+        ),
+        migrations.RunPython(add_parser_specs, migrations.RunPython.noop),
+    ]
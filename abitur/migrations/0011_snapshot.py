@@ -0,0 +1,37 @@
+# Generated by Django 3.0.7 on 2026-10-18 06:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abitur', '0010_parserspec'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Snapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('total', models.PositiveIntegerField()),
+                ('bvi', models.PositiveIntegerField()),
+                ('funded_only', models.PositiveIntegerField()),
+                ('joined', models.PositiveIntegerField()),
+                ('withdrawn', models.PositiveIntegerField()),
+                ('student_ids', models.BinaryField()),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='snapshots', to='abitur.CrawlJob')),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='abitur.School')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='snapshot',
+            index=models.Index(fields=['school', '-created_at'], name='snapshot_school_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.0.7 on 2026-10-18 06:52
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.utils.timezone
+
+
+def normalize_name(name):
+    return ' '.join(name.replace('ё', 'е').replace('Ё', 'Е').split()).lower().title()
+
+
+def fill_overlap(apps, schema_editor):
+    student_model = apps.get_model('abitur', 'Student')
+    overlap_model = apps.get_model('abitur', 'Overlap')
+    students = [
+        student_model(pk=pk, normalized_name=normalize_name(name))
+        for pk, name in student_model.objects.values_list('pk', 'name')
+    ]
+    student_model.objects.bulk_update(students, ['normalized_name'], batch_size=500)
+
+    overlap = student_model.objects.order_by().values('normalized_name').annotate(
+        school_count=Count('school', distinct=True)).filter(school_count__gt=1)
+    overlap_model.objects.bulk_create(overlap_model(**row) for row in overlap)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abitur', '0011_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Overlap',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('normalized_name', models.CharField(max_length=100, unique=True)),
+                ('school_count', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='normalized_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['normalized_name', 'school'], name='student_normalized_name_idx'),
+        ),
+        migrations.RunPython(fill_overlap, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.0.7 on 2026-10-18 08:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_spec(apps, schema_editor):
+    student_model = apps.get_model('abitur', 'Student')
+    spec_model = apps.get_model('abitur', 'ParserSpec')
+
+    # Students were only told apart by school and BVI, so they go to the first spec listing them.
+    for spec in spec_model.objects.order_by('pk'):
+        bvi_values = {spec.bvi}
+        if 'bvi' in [name.strip() for name in spec.categories.split(',')]:
+            bvi_values.add(True)
+        student_model.objects.filter(school_id=spec.school_id, bvi__in=bvi_values, spec__isnull=True).update(
+            spec=spec
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('abitur', '0012_overlap'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='student',
+            name='student_key_idx',
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='spec',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='students', to='abitur.ParserSpec'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['name', 'school', 'spec', 'application_date', 'bvi'], name='student_key_idx'),
+        ),
+        migrations.RunPython(fill_spec, migrations.RunPython.noop),
+    ]
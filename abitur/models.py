@@ -1,4 +1,7 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Count, Q
+from django.utils import timezone
 
 SECHENOVA = "Сеченовка"
 PIROGOVA = "Пироговка"
@@ -13,6 +16,14 @@ class Student(models.Model):
         on_delete=models.DO_NOTHING,
         related_name='students'
     )
+    # List the student was read from; a school may publish several.
+    spec = models.ForeignKey(
+        'ParserSpec',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='students',
+    )
     bvi = models.BooleanField()
     application_date = models.DateField()
     funded_only = models.BooleanField()
@@ -22,12 +33,24 @@ class Student(models.Model):
     is_winner = models.BooleanField(
         default=False,
     )
+    # Name used to match applicants across schools, see utils.normalize_name.
+    normalized_name = models.CharField(
+        max_length=100,
+        blank=True,
+    )
 
     def __str__(self):
         return self.name
 
     class Meta:
-        ordering = ['-application_date']
+        ordering = ['-application_date', '-id']
+        indexes = [
+            models.Index(fields=['-application_date', '-id'], name='student_date_idx'),
+            models.Index(fields=['school', 'bvi', 'funded_only'], name='student_school_flags_idx'),
+            models.Index(fields=['school'], condition=Q(is_winner=True), name='student_winner_idx'),
+            models.Index(fields=['name', 'school', 'spec', 'application_date', 'bvi'], name='student_key_idx'),
+            models.Index(fields=['normalized_name', 'school'], name='student_normalized_name_idx'),
+        ]
 
 
 class School(models.Model):
@@ -39,33 +62,357 @@ class School(models.Model):
         return self.name
 
 
-def sech_count(qs):
-    return qs.filter(school__name=SECHENOVA).count()
+STUDENT_COUNTERS = {
+    'total_count': Q(),
+    'sech_count': Q(school__name=SECHENOVA),
+    'sech_bvi_count': Q(school__name=SECHENOVA, bvi=True),
+    'sech_funded_only_count': Q(school__name=SECHENOVA, funded_only=True),
+    'sechenova_winners_count': Q(school__name=SECHENOVA, is_winner=True),
+    'pirogova_count': Q(school__name=PIROGOVA),
+    'pirogova_bvi_count': Q(school__name=PIROGOVA, bvi=True),
+    'pirogova_funded_only_count': Q(school__name=PIROGOVA, funded_only=True),
+    'pirogova_winners_count': Q(school__name=PIROGOVA, is_winner=True),
+}
+
+
+class Source(models.Model):
+    parser = models.CharField(
+        max_length=100,
+        unique=True,
+    )
+    url = models.CharField(
+        max_length=500,
+        blank=True,
+    )
+    etag = models.CharField(
+        max_length=200,
+        blank=True,
+    )
+    last_modified = models.CharField(
+        max_length=100,
+        blank=True,
+    )
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+    )
+    ingested_hash = models.CharField(
+        max_length=64,
+        blank=True,
+    )
+    checked_at = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+    ingested_at = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
+    def __str__(self):
+        return self.parser
+
+    @property
+    def changed(self):
+        return not self.content_hash or self.content_hash != self.ingested_hash
+
+
+class ParserSpec(models.Model):
+    """
+    Where to find an applicant list and how to read it.
+
+    Columns layout: every table has a header row and name_column and
+    date_column are its cells. Sections layout: the list is a run of
+    numbered rows between section_start and section_end headers, and the
+    columns are given by their numbers.
+
+    Every line of section_start and section_end is a marker; it matches a
+    row whose first cell contains all of its parts separated by ";".
+    categories names the numbered lists of the document in order: students
+    of "general" that are absent from "contract" are funded only, "bvi" is
+    a list of BVI students, "special" and "target" lists are read past.
+    """
+    COLUMNS = 'columns'
+    SECTIONS = 'sections'
+
+    LAYOUT_CHOICES = (
+        (COLUMNS, 'Таблица с заголовками'),
+        (SECTIONS, 'Разделы'),
+    )
+    CATEGORY_NAMES = ('general', 'contract', 'bvi', 'special', 'target')
+
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+    )
+    school = models.ForeignKey(
+        'School',
+        on_delete=models.CASCADE,
+        related_name='parser_specs',
+    )
+    campaign = models.PositiveSmallIntegerField()
+    is_active = models.BooleanField(
+        default=True,
+    )
+    layout = models.CharField(
+        max_length=10,
+        choices=LAYOUT_CHOICES,
+    )
+    base_url = models.CharField(
+        max_length=200,
+    )
+    page_url = models.CharField(
+        max_length=500,
+    )
+    link_text = models.CharField(
+        max_length=300,
+    )
+    pages = models.CharField(
+        max_length=50,
+        default='all',
+    )
+    extraction_backend = models.CharField(
+        max_length=20,
+        default='pdfminer',
+    )
+    name_column = models.CharField(
+        max_length=100,
+    )
+    date_column = models.CharField(
+        max_length=100,
+    )
+    section_start = models.TextField(
+        blank=True,
+    )
+    section_end = models.TextField(
+        blank=True,
+    )
+    categories = models.CharField(
+        max_length=200,
+    )
+    bvi = models.BooleanField(
+        default=False,
+    )
+
+    def __str__(self):
+        return f'{self.name} ({self.campaign})'
+
+    def clean(self):
+        errors = {}
+        names = self.category_names
+        unknown = [name for name in names if name not in self.CATEGORY_NAMES]
+
+        if unknown:
+            errors['categories'] = f'Неизвестные списки: {", ".join(unknown)}. ' \
+                                   f'Допустимые: {", ".join(self.CATEGORY_NAMES)}.'
+        elif len(set(names)) != len(names):
+            errors['categories'] = 'Списки не должны повторяться.'
+
+        if self.layout == self.SECTIONS:
+            for field in ('name_column', 'date_column'):
+                if not getattr(self, field).strip().isdigit():
+                    errors[field] = 'Для разделов укажите номер столбца.'
 
+        if errors:
+            raise ValidationError(errors)
 
-def sech_bvi_count(qs):
-    return qs.filter(school__name=SECHENOVA, bvi=True).count()
+    @property
+    def category_names(self):
+        return [name.strip() for name in self.categories.split(',')]
 
+    @property
+    def start_markers(self):
+        return parse_markers(self.section_start)
 
-def pirogova_count(qs):
-    return qs.filter(school__name=PIROGOVA).count()
+    @property
+    def end_markers(self):
+        return parse_markers(self.section_end)
 
+    class Meta:
+        ordering = ['school', 'name']
+
+
+def parse_markers(text):
+    return [[part.strip() for part in line.split(';')] for line in text.splitlines() if line.strip()]
+
+
+class CrawlJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    PARTIAL = 'partial'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Завершено'),
+        (PARTIAL, 'Частично'),
+        (FAILED, 'Ошибка'),
+    )
+    ACTIVE_STATUSES = (PENDING, RUNNING)
+
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+    inserted = models.PositiveIntegerField(
+        default=0,
+    )
+    updated = models.PositiveIntegerField(
+        default=0,
+    )
+    unchanged = models.PositiveIntegerField(
+        default=0,
+    )
+    deleted = models.PositiveIntegerField(
+        default=0,
+    )
+    error = models.TextField(
+        blank=True,
+    )
+    parsers = models.CharField(
+        max_length=255,
+        blank=True,
+    )
+    attempt = models.PositiveSmallIntegerField(
+        default=0,
+    )
+    run_after = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
+    def __str__(self):
+        return f'{self.created_at:%d.%m.%Y %H:%M} ({self.status})'
+
+    @property
+    def parser_names(self):
+        return self.parsers.split(',') if self.parsers else []
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    def to_dict(self):
+        return dict(
+            id=self.pk,
+            status=self.status,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            inserted=self.inserted,
+            updated=self.updated,
+            unchanged=self.unchanged,
+            deleted=self.deleted,
+            error=self.error,
+            parsers=self.parser_names,
+            attempt=self.attempt,
+        )
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['status'],
+                condition=Q(status='pending'),
+                name='single_pending_crawl_job',
+            ),
+        ]
+
+
+class TimingSpan(models.Model):
+    job = models.ForeignKey(
+        'CrawlJob',
+        on_delete=models.CASCADE,
+        related_name='spans',
+    )
+    parser = models.CharField(
+        max_length=100,
+        blank=True,
+    )
+    stage = models.CharField(
+        max_length=100,
+    )
+    started_at = models.DateTimeField()
+    duration = models.FloatField()
+    profile = models.CharField(
+        max_length=255,
+        blank=True,
+    )
+
+    def __str__(self):
+        return f'{self.parser} {self.stage}: {self.duration:.3f}s'
+
+    class Meta:
+        ordering = ['started_at']
 
-def pirogova_bvi_count(qs):
-    return qs.filter(school__name=PIROGOVA, bvi=True).count()
 
+class Snapshot(models.Model):
+    """Students of a school after a crawl; written only when something changed."""
+    job = models.ForeignKey(
+        'CrawlJob',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='snapshots',
+    )
+    school = models.ForeignKey(
+        'School',
+        on_delete=models.CASCADE,
+        related_name='snapshots',
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+    )
+    total = models.PositiveIntegerField()
+    bvi = models.PositiveIntegerField()
+    funded_only = models.PositiveIntegerField()
+    joined = models.PositiveIntegerField()
+    withdrawn = models.PositiveIntegerField()
+    # Sorted student ids, see utils.pack_ids.
+    student_ids = models.BinaryField()
 
-def sech_funded_only_count(qs):
-    return qs.filter(school__name=SECHENOVA, funded_only=True).count()
+    def __str__(self):
+        return f'{self.school} {self.created_at:%d.%m.%Y %H:%M}: {self.total}'
 
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['school', '-created_at'], name='snapshot_school_idx'),
+        ]
 
-def pirogova_funded_only_count(qs):
-    return qs.filter(school__name=PIROGOVA, funded_only=True).count()
 
+class Overlap(models.Model):
+    """Applicants listed by more than one school, refreshed on every ingest."""
+    normalized_name = models.CharField(
+        max_length=100,
+        unique=True,
+    )
+    school_count = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField(
+        default=timezone.now,
+    )
 
-def pirogova_winners_count(qs):
-    return qs.filter(school__name=PIROGOVA, is_winner=True).count()
+    def __str__(self):
+        return self.normalized_name
+
+    class Meta:
+        ordering = ['-created_at']
 
 
-def sechenova_winners_count(qs):
-    return qs.filter(school__name=SECHENOVA, is_winner=True).count()
+def student_counts(qs):
+    counters = {name: Count('pk', filter=condition) for name, condition in STUDENT_COUNTERS.items()}
+    return qs.order_by().aggregate(**counters)
@@ -1,13 +1,18 @@
 import asyncio
 import logging
 
-from collections import namedtuple
-
+import pandas as pd
 from bs4 import BeautifulSoup
-from camelot import read_pdf
+from camelot.handlers import PDFHandler
 from aiohttp import ClientConnectionError
+from django.conf import settings
+from django.utils import timezone
 
-from .utils import table_rows, make_date, get_school
+from .extraction import get_backend, page_hashes
+from .models import ParserSpec
+from .pdfcache import PDFCache, PageTables
+from .timing import Timings, run_profiled
+from .utils import table_rows, table_frame, make_date, make_dates, find_funded
 
 
 logger = logging.getLogger(__name__)
@@ -19,23 +24,65 @@ h = logging.StreamHandler()
 h.setFormatter(formatter)
 logger.addHandler(h)
 
-PIROGOVA = "Пироговка"
-SECHENOVA = 'Сеченовка'
-pirogova_categories = namedtuple(
-    'pirogova_categories', 'bvi special general contract')
-sechenova_categories = namedtuple(
-    'sechenova_categories', 'contract general')
-sechenova_bvi_categories = namedtuple(
-    'sechenova_bvi_categories', 'general contract')
-
-parser_registry = []
+layouts = {}
 
 
 def register(parser_class):
-    parser_registry.append(parser_class)
+    layouts[parser_class.layout] = parser_class
     return parser_class
 
 
+def make_parser(spec):
+    return layouts[spec.layout](spec)
+
+
+def get_parsers(names=None):
+    specs = ParserSpec.objects.filter(is_active=True).select_related('school')
+
+    if names:
+        specs = specs.filter(name__in=names)
+
+    return [make_parser(spec) for spec in specs]
+
+
+def matches(markers, text):
+    return any(all(part in text for part in marker) for marker in markers)
+
+
+def marker_mask(texts, markers):
+    mask = pd.Series(False, index=texts.index)
+
+    for marker in markers:
+        marker_matches = pd.Series(True, index=texts.index)
+        for part in marker:
+            marker_matches &= texts.str.contains(part, regex=False)
+        mask |= marker_matches
+
+    return mask
+
+
+def get_page_numbers(path, pages):
+    return PDFHandler(path, pages=pages).pages
+
+
+def get_page_hashes(path, pages):
+    hashes = page_hashes(path)
+    return {page: hashes[page - 1] for page in get_page_numbers(path, pages)}
+
+
+def split_pages(page_numbers, pages_per_task):
+    for start in range(0, len(page_numbers), pages_per_task):
+        yield ','.join(str(page) for page in page_numbers[start:start + pages_per_task])
+
+
+def extract_tables(path, pages, backend):
+    return get_backend(backend).extract(path, pages)
+
+
+def extract_page_tables(path, pages, backend):
+    return [(int(page), extract_tables(path, page, backend)) for page in pages.split(',')]
+
+
 class Category:
 
     def __init__(self, raw_students, bvi=False, funded_only=False):
@@ -50,79 +97,229 @@ class Category:
         for student in self._students:
             yield student
 
-    def make_student(self, name, date, school):
+    def make_student(self, name, date, school, spec):
         student = dict(
             name=name.lower().title(),
             bvi=self.bvi,
-            application_date=make_date(date),
+            application_date=date,
             school=school,
+            spec=spec,
             funded_only=self.funded_only
         )
         return student
 
 
 class Parser:
-    link_text = ''
-    base_url = ''
-    page_url = ''
-    pages = ''
-    school_name = None
-
-    def __init__(self):
-        self._raw_categories = None
+    layout = None
+    fallback_backend = 'camelot'
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec.name
+        self.link_text = spec.link_text
+        self.base_url = spec.base_url
+        self.page_url = spec.page_url
+        self.pages = spec.pages
+        self.extraction_backend = spec.extraction_backend
+        self._raw_categories = [[] for _ in spec.category_names]
         self.categories = {}
         self._page = None
-        self._school = None
+        self._school = spec.school
         self.source_url = ''
+        self.content_hash = ''
+        self.timings = Timings(self.name)
 
     async def run(self, session, executor):
         logger.debug('Parser is running.')
-        await self.get_page(session)
-        self._school = await get_school(self.school_name)
+        if self._page is None:
+            await self.get_page(session)
+        # The source is resolved already when the crawler checked it.
+        if not self.source_url:
+            await asyncio.get_event_loop().run_in_executor(None, self.get_source)
+        pdf_cache = PDFCache(settings.PDF_CACHE_DIR)
+        content_hash = await self.fetch_file(session, pdf_cache)
+
+        with self.timings.span('extract'):
+            file = await self.extract_file(pdf_cache.pdf_path(content_hash), executor)
+        logger.debug('File processed.')
+
+        # Tables are read from the page cache page by page, the document is never held as a whole.
+        self.parse_tables(file)
+        logger.debug(f'Parser finished, {len(self)} students added.')
+        return self
+
+    async def extract_file(self, path, executor):
+        backends = [self.extraction_backend]
+        if self.extraction_backend != self.fallback_backend:
+            backends.append(self.fallback_backend)
+
+        for backend in backends:
+            file = await self.extract_pages(path, executor, backend)
+            if self.validate(file):
+                return file
+
+            logger.debug(f'{backend} extraction of {self.source_url} is not valid.')
+            file.discard()
+
+        raise ValueError(f'No valid extraction of {self.source_url}')
+
+    async def extract_pages(self, path, executor, backend):
         loop = asyncio.get_event_loop()
-        process_task = loop.run_in_executor(executor, self._run)
-        finished_parser = await process_task
-        logger.debug('Parser finished.')
-        return finished_parser
+        pdf_cache = PDFCache(settings.PDF_CACHE_DIR)
+        hashes = await loop.run_in_executor(None, get_page_hashes, path, self.pages)
+        changed_pages = [page for page, page_hash in hashes.items() if not pdf_cache.has_page(page_hash, backend)]
+        tasks = []
+
+        for pages in split_pages(changed_pages, settings.CRAWLER_PAGES_PER_TASK):
+            profile_path = self.timings.profile_path(f'extract-{backend}-{pages.replace(",", "_")}')
+            if profile_path:
+                task = loop.run_in_executor(
+                    executor, run_profiled, profile_path, extract_page_tables, path, pages, backend
+                )
+            else:
+                task = loop.run_in_executor(executor, extract_page_tables, path, pages, backend)
+            tasks.append(task)
+            logger.debug(f'Pages {pages} of {self.source_url} queued.')
+
+        # Every chunk goes to the page cache as soon as it is done, and is read from there when parsed.
+        for task in asyncio.as_completed(tasks):
+            for page, tables in await task:
+                pdf_cache.store_page(hashes[page], backend, tables)
+
+        logger.debug(f'{len(changed_pages)} of {len(hashes)} pages of {self.source_url} changed and were extracted.')
+        return PageTables(pdf_cache, [hashes[page] for page in sorted(hashes)], backend)
 
     def __len__(self):
         return sum([len(category) for category in self.categories.values()])
 
+    @property
+    def scope(self):
+        """Spec whose students this parser lists in full."""
+        if not self.categories:
+            return None
+        return self.spec
+
     def __iter__(self):
         for category in self.categories.values():
             for student in category:
-                yield category.make_student(*student, self._school)
+                yield category.make_student(*student, self._school, self.spec)
 
     async def get_page(self, session):
-        async with session.get(self.page_url) as response:
-            logger.debug(f'Response received from {self.source_url} with status {response.status}.')
-            if response.status != 200:
-                raise ClientConnectionError()
-            self._page = await response.read()
+        with self.timings.span('fetch_page'):
+            async with session.get(self.page_url) as response:
+                logger.debug(f'Response received from {self.source_url} with status {response.status}.')
+                if response.status != 200:
+                    raise ClientConnectionError()
+                self._page = await response.read()
 
     def get_source(self):
-        soup = BeautifulSoup(self._page, 'html.parser')
-        link_element = soup.find('a', text=self.link_text)
+        with self.timings.span('resolve_source', profile=True):
+            soup = BeautifulSoup(self._page, 'html.parser')
+            link_element = soup.find('a', text=self.link_text)
 
         if not link_element:
             raise ClientConnectionError('Link not found')
 
         self.source_url = self.base_url + link_element.get('href', '')
 
-    def get_file(self):
-        self.get_source()
-        file = read_pdf(self.source_url, pages=self.pages)
-        return file
+    async def check_file(self, session, source):
+        same_url = source.url == self.source_url
+
+        if same_url and (source.etag or source.last_modified):
+            async with session.head(self.source_url) as response:
+                etag = response.headers.get('ETag', '')
+                last_modified = response.headers.get('Last-Modified', '')
+                if response.status == 200 and (etag, last_modified) == (source.etag, source.last_modified):
+                    logger.debug(f'{self.source_url} is not modified (HEAD).')
+                    source.checked_at = timezone.now()
+                    return source
+
+        headers = {}
+        if same_url and source.etag:
+            headers['If-None-Match'] = source.etag
+        if same_url and source.last_modified:
+            headers['If-Modified-Since'] = source.last_modified
+
+        with self.timings.span('download_pdf'):
+            async with session.get(self.source_url, headers=headers) as response:
+                logger.debug(f'Response received from {self.source_url} with status {response.status}.')
+                if response.status == 304 and headers:
+                    source.checked_at = timezone.now()
+                    return source
+                if response.status != 200:
+                    raise ClientConnectionError()
+                content = await response.read()
+
+        # The downloaded PDF is kept, so the crawl doesn't download it again.
+        source.url = self.source_url
+        source.etag = response.headers.get('ETag', '')
+        source.last_modified = response.headers.get('Last-Modified', '')
+        source.content_hash = await self.store_file(content, source.etag, source.last_modified)
+        source.checked_at = timezone.now()
+        return source
+
+    async def fetch_file(self, session, pdf_cache):
+        entry = pdf_cache.entry(self.source_url)
+
+        if entry and entry['content_hash'] == self.content_hash:
+            logger.debug(f'{self.source_url} is already downloaded.')
+            return entry['content_hash']
+
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        with self.timings.span('download_pdf'):
+            async with session.get(self.source_url, headers=headers) as response:
+                logger.debug(f'Response received from {self.source_url} with status {response.status}.')
+                if response.status == 304 and headers:
+                    return entry['content_hash']
+                if response.status != 200:
+                    raise ClientConnectionError(f'Failed to download {self.source_url}')
+                content = await response.read()
+
+        etag = response.headers.get('ETag', '')
+        last_modified = response.headers.get('Last-Modified', '')
+        return await self.store_file(content, etag, last_modified, pdf_cache)
+
+    async def store_file(self, content, etag, last_modified, pdf_cache=None):
+        pdf_cache = pdf_cache or PDFCache(settings.PDF_CACHE_DIR, settings.PDF_CACHE_MAX_AGE)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, pdf_cache.store, self.source_url, content, etag, last_modified)
 
-    def _run(self):
-        logger.debug('Parsing...')
-        file = self.get_file()
-        logger.debug('File processed.')
-        self.parse_tables(file)
-        logger.debug(f'{len(self)} students added.')
-        return self
+    def validate(self, file):
+        """
+        Whether the tables split into the categories of the spec the way parse_rows reads them.
+
+        A section may have no students yet, otherwise every category must be found.
+        """
+        if next(iter(file), None) is None:
+            return False
+
+        scratch = type(self)(self.spec)
+        try:
+            scratch.parse_rows(file)
+        except (ValueError, IndexError):
+            return False
+
+        categories = [category for category in scratch._raw_categories if category]
+        if categories and len(categories) != len(scratch._raw_categories):
+            return False
+        return all(name for category in categories for name, _ in category)
 
     def parse_tables(self, file):
+        with self.timings.span('parse_tables', profile=True):
+            if settings.PARSE_VECTORIZED:
+                self.parse_frame(file)
+            else:
+                self.parse_rows(file)
+
+        with self.timings.span('clean_categories', profile=True):
+            self.clean_categories()
+
+    def parse_rows(self, file):
         next_student_number = 1
         current_category_index = 0
         current_category = self._raw_categories[current_category_index]
@@ -130,86 +327,86 @@ class Parser:
         for row, name_index, date_index in self.clean_rows(file):
             if int(row[0]) == next_student_number:
                 next_student_number += 1
+            elif int(row[0]) != 1:
+                raise ValueError(f'Student {next_student_number} is missing from the list')
             else:
                 current_category_index += 1
                 current_category = self._raw_categories[current_category_index]
                 next_student_number = 2
 
-            name, date = row[name_index], row[date_index]
+            name, date = row[name_index], make_date(row[date_index])
             current_category.append((name, date))
 
-        self.clean_categories()
+    def parse_frame(self, file):
+        frame = self.clean_frame(table_frame(file, self.find_columns))
+        numbers = pd.to_numeric(frame['number'])
+        # Every category is numbered from 1, so a new one starts wherever the numbering doesn't continue.
+        category_indices = (numbers != numbers.shift(fill_value=0) + 1).cumsum()
+        students = pd.DataFrame({'category': category_indices, 'name': frame['name'],
+                                 'date': make_dates(frame['date'])})
+
+        for category_index, rows in students.groupby('category', sort=False):
+            self._raw_categories[category_index].extend(zip(rows['name'], rows['date']))
 
     def clean_rows(self, file):
         raise NotImplementedError("Each Parser subclass must implement it's own method")
 
-    def clean_categories(self):
+    def clean_frame(self, frame):
+        raise NotImplementedError("Each Parser subclass must implement it's own method")
+
+    def find_columns(self, table):
         raise NotImplementedError("Each Parser subclass must implement it's own method")
 
+    def clean_categories(self):
+        raw_categories = dict(zip(self.spec.category_names, self._raw_categories))
+        bvi = raw_categories.get('bvi', [])
+        general = set(raw_categories.get('general', [])) ^ set(bvi)
+        funded_only, except_funded_only = find_funded(general, raw_categories.get('contract', []))
+        self.categories = {}
 
-@register
-class PirogovaParser(Parser):
-    link_text = '06.03.01 Биология'
-    base_url = 'http://rsmu.ru/'
-    page_url = 'http://rsmu.ru/21087.html'
-    pages = 'all'
-    school_name = PIROGOVA
+        if 'bvi' in raw_categories:
+            self.categories['bvi'] = Category(bvi, bvi=True)
+
+        self.categories['funded_only'] = Category(funded_only, bvi=self.spec.bvi, funded_only=True)
+        self.categories['general'] = Category(except_funded_only, bvi=self.spec.bvi)
 
-    def __init__(self):
-        super().__init__()
-        self._raw_categories = pirogova_categories(bvi=[], special=[], general=[], contract=[])
+
+@register
+class ColumnsParser(Parser):
+    layout = ParserSpec.COLUMNS
 
     def clean_rows(self, file):
         for row, name_index, date_index in table_rows(file, self.find_columns):
             if row[0] and row[0] != '№':
                 yield row, name_index, date_index
 
-    def clean_categories(self):
-        general_set = set(self._raw_categories.general) ^ set(self._raw_categories.bvi)
-        contract_set = set(self._raw_categories.contract)
-        funded_only = general_set - contract_set
-        except_funded_only = general_set - funded_only
-
-        self.categories = {
-            'bvi': Category(self._raw_categories.bvi, bvi=True),
-            'funded_only': Category(funded_only, funded_only=True),
-            'general': Category(except_funded_only)
-        }
-
-    @staticmethod
-    def find_columns(table):
-        head_row = table.data[0]
+    def clean_frame(self, frame):
+        return frame[(frame['number'] != '') & (frame['number'] != '№')]
+
+    def find_columns(self, table):
+        head_row = [' '.join(cell.split()) for cell in table.data[0]]
         try:
-            date = head_row.index('Дата подачи \nзаявления')
-            name = head_row.index('Фамилия, имя, отчество')
+            date = head_row.index(self.spec.date_column)
+            name = head_row.index(self.spec.name_column)
         except ValueError as e:
             raise ValueError('Column not found in row') from e
         return name, date
 
 
 @register
-class SechenovaParser(Parser):
-    link_text = 'Бакалавриат, специалитет - список лиц подавших документы.pdf'
-    link_bvi_text = 'Бакалавриат, специалитет - список лиц подавших документы без ВИ.pdf'
-    base_url = 'https://www.sechenov.ru/'
-    page_url = 'https://www.sechenov.ru/admissions/priemnaya-kampaniya-2020/' \
-               'spiski-lits-podavshikh-dokumenty-2020-2021.php'
-    pages = '1-8'
-    school_name = SECHENOVA
-
-    def __init__(self):
-        super().__init__()
-        self._raw_categories = sechenova_categories(contract=[], general=[])
+class SectionsParser(Parser):
+    layout = ParserSpec.SECTIONS
 
     def clean_rows(self, file):
-        go = False
+        start_markers, end_markers = self.spec.start_markers, self.spec.end_markers
+        go = not start_markers
 
         for row, name_index, date_index in table_rows(file, self.find_columns):
-            if self.start_predicate(row):
+            if matches(start_markers, row[0]):
                 go = True
             if not go:
                 continue
-            if self.break_predicate(row):
+            if matches(end_markers, row[0]):
                 break
             if '\n' in row[0]:
                 row = row[0].split('\n')
@@ -217,48 +414,20 @@ class SechenovaParser(Parser):
                 continue
             yield row, name_index, date_index
 
-    def clean_categories(self):
-        general_set = set(self._raw_categories.general)
-        contract_set = set(self._raw_categories.contract)
-        funded_only = general_set - contract_set
-        except_funded_only = general_set - funded_only
-
-        self.categories = {
-            'funded_only': Category(funded_only, funded_only=True),
-            'general': Category(except_funded_only)
-        }
-
-    @staticmethod
-    def break_predicate(row):
-        return ('06.05.01' in row[0] and 'особой' in row[0]) or '19.03.01' in row[0]
-
-    @staticmethod
-    def start_predicate(row):
-        return '06.05.01' in row[0]
+    def clean_frame(self, frame):
+        start_markers, end_markers = self.spec.start_markers, self.spec.end_markers
+        first = frame['number']
+        started = marker_mask(first, start_markers).cummax() if start_markers else pd.Series(True, index=first.index)
+        stopped = (started & marker_mask(first, end_markers)).cummax()
+        frame = frame[started & ~stopped].copy()
 
-    @staticmethod
-    def find_columns(_):
-        name_index = 1
-        date_index = 2
-        return name_index, date_index
+        # Rows extracted as a single cell hold all their columns separated by newlines.
+        multiline = frame['number'].str.contains('\n', regex=False)
+        if multiline.any():
+            cells = frame.loc[multiline, 'number'].str.split('\n', expand=True).reindex(columns=range(3))
+            frame.loc[multiline, ['number', 'name', 'date']] = cells.values
 
+        return frame[frame['number'].str.isdigit()]
 
-@register
-class SechenovaBVIParser(SechenovaParser):
-    link_text = 'Бакалавриат, специалитет - список лиц подавших документы без ВИ.pdf'
-    pages = 'all'
-
-    def __init__(self):
-        super().__init__()
-        self._raw_categories = sechenova_bvi_categories(general=[], contract=[])
-
-    def clean_categories(self):
-        general_set = set(self._raw_categories.general)
-        contract_set = set(self._raw_categories.contract)
-        funded_only = general_set - contract_set
-        except_funded_only = general_set - funded_only
-
-        self.categories = {
-            'funded_only': Category(funded_only, bvi=True, funded_only=True),
-            'general': Category(except_funded_only, bvi=True),
-        }
+    def find_columns(self, _):
+        return int(self.spec.name_column), int(self.spec.date_column)
@@ -0,0 +1,141 @@
+import gzip
+import json
+import os
+import tempfile
+import time
+from collections import namedtuple
+from hashlib import sha1, sha256
+
+
+CachedTable = namedtuple('CachedTable', 'data')
+
+
+class PageTables:
+    """Tables of a document, read from the page cache one page at a time on every iteration."""
+
+    def __init__(self, pdf_cache, page_hashes, backend):
+        self.pdf_cache = pdf_cache
+        self.page_hashes = page_hashes
+        self.backend = backend
+
+    def __iter__(self):
+        for page_hash in self.page_hashes:
+            for rows in self.pdf_cache.load_page(page_hash, self.backend) or []:
+                yield CachedTable(rows)
+
+    def discard(self):
+        for page_hash in self.page_hashes:
+            self.pdf_cache.remove_page(page_hash, self.backend)
+
+
+class PDFCache:
+    """
+    Downloaded PDFs, keyed by content hash, and the table rows extracted from their pages, keyed by page hash.
+
+    A PDF is removed once its URL serves new content. Page entries are shared
+    between PDFs, so they are kept while they are read and pruned max_age
+    seconds after the last read instead.
+    """
+
+    def __init__(self, directory, max_age=None):
+        self.directory = directory
+        self.max_age = max_age
+
+    def entry(self, url):
+        """Validators and content hash of the last download of url, if its PDF is still cached."""
+        entry = self._read(self._index_name(url)) or {}
+        if not entry.get('content_hash') or not os.path.exists(self.pdf_path(entry['content_hash'])):
+            return {}
+        return entry
+
+    def store(self, url, content, etag='', last_modified=''):
+        previous_hash = (self._read(self._index_name(url)) or {}).get('content_hash')
+        content_hash = sha256(content).hexdigest()
+        self._write_bytes(self.pdf_path(content_hash), content)
+        self._write(self._index_name(url), {
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_hash': content_hash,
+        })
+
+        if previous_hash and previous_hash != content_hash:
+            self._remove(self.pdf_path(previous_hash))
+
+        if self.max_age:
+            self.prune_pages(self.max_age)
+
+        return content_hash
+
+    def pdf_path(self, content_hash):
+        return os.path.join(self.directory, f'{content_hash}.pdf')
+
+    def has_page(self, page_hash, backend):
+        """Whether tables of the page are cached; the entry counts as read, so it isn't pruned meanwhile."""
+        return self._touch(os.path.join(self.directory, self._page_name(page_hash, backend)))
+
+    def load_page(self, page_hash, backend):
+        tables = self._read(self._page_name(page_hash, backend))
+        if tables is not None:
+            self._touch(os.path.join(self.directory, self._page_name(page_hash, backend)))
+        return tables
+
+    def store_page(self, page_hash, backend, tables):
+        self._write(self._page_name(page_hash, backend), tables)
+
+    def remove_page(self, page_hash, backend):
+        self._remove(os.path.join(self.directory, self._page_name(page_hash, backend)))
+
+    def prune_pages(self, max_age):
+        """Remove page entries that were not read or written for max_age seconds."""
+        expired = time.time() - max_age
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.startswith('page-') and os.path.getmtime(path) < expired:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _index_name(url):
+        return f'url-{sha1(url.encode()).hexdigest()}.json.gz'
+
+    @staticmethod
+    def _page_name(page_hash, backend):
+        return f'page-{page_hash}-{backend}.json.gz'
+
+    def _read(self, name):
+        try:
+            with gzip.open(os.path.join(self.directory, name), 'rt', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, name, data):
+        content = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+        self._write_bytes(os.path.join(self.directory, name), gzip.compress(content))
+
+    def _write_bytes(self, path, content):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+
+        with os.fdopen(fd, 'wb') as file:
+            file.write(content)
+
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
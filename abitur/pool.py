@@ -0,0 +1,81 @@
+import importlib
+import logging
+import time
+from concurrent import futures
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+formatter = logging.Formatter(
+    '%(asctime)s - %(process)d - %(name)s - %(funcName)s - %(message)s', datefmt='[%H:%M:%S]'
+)
+h = logging.StreamHandler()
+h.setFormatter(formatter)
+logger.addHandler(h)
+
+WARM_UP_MODULES = ('pandas', 'cv2', 'camelot', 'camelot.parsers')
+
+_worker_pool = None
+
+
+def warm_up(_):
+    for module in WARM_UP_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+
+class WorkerPool(futures.Executor):
+
+    def __init__(self, max_workers, max_tasks_per_child):
+        self.max_workers = max_workers
+        self.max_tasks_per_child = max_tasks_per_child
+        self.startup_time = None
+        self._executor = None
+        self._tasks = 0
+
+    @property
+    def started(self):
+        return self._executor is not None
+
+    def start(self):
+        started_at = time.perf_counter()
+        self._executor = futures.ProcessPoolExecutor(max_workers=self.max_workers)
+        list(self._executor.map(warm_up, range(self.max_workers)))
+        self.startup_time = time.perf_counter() - started_at
+        self._tasks = 0
+        logger.debug(f'Pool of {self.max_workers} workers started in {self.startup_time:.2f}s.')
+
+    def recycle(self):
+        # ProcessPoolExecutor cannot retire single workers before Python 3.11,
+        # so the whole pool is replaced once every worker has used up its share.
+        if self.started and self._tasks >= self.max_workers * self.max_tasks_per_child:
+            logger.debug(f'Recycling pool after {self._tasks} tasks.')
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+        if not self.started:
+            self.start()
+
+    def submit(self, fn, *args, **kwargs):
+        if not self.started:
+            self.start()
+        self._tasks += 1
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        if self.started:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+def get_worker_pool():
+    global _worker_pool
+
+    if _worker_pool is None:
+        _worker_pool = WorkerPool(settings.CRAWLER_WORKERS, settings.CRAWLER_MAX_TASKS_PER_CHILD)
+
+    return _worker_pool
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from aiohttp import ClientError
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .crawler import AsyncCrawler, backoff_delay
+from .models import CrawlJob, Source, TimingSpan
+from .parsers import get_parsers
+from .timing import Timings
+from .utils import bump_data_version, update_records, take_snapshots
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+formatter = logging.Formatter(
+    '%(asctime)s - %(process)d - %(name)s - %(funcName)s - %(message)s', datefmt='[%H:%M:%S]'
+)
+h = logging.StreamHandler()
+h.setFormatter(formatter)
+logger.addHandler(h)
+
+SOURCES_KEY = 'sources'
+
+
+def store_sources_status(ok, changed=None):
+    status = {'ok': ok, 'changed': changed, 'checked_at': timezone.now()}
+    cache.set(SOURCES_KEY, status)
+    return status
+
+
+def refresh_sources():
+    crawler = AsyncCrawler(*get_parsers())
+
+    try:
+        sources = crawler.check_sources()
+    except (ClientError, asyncio.TimeoutError) as e:
+        logger.debug(f'Sources check failed: {e!r}')
+        return store_sources_status(False)
+
+    return store_sources_status(True, any(source.changed for source in sources))
+
+
+def get_sources():
+    return cache.get(SOURCES_KEY)
+
+
+def mark_ingested(parsers):
+    now = timezone.now()
+
+    for parser in parsers:
+        Source.objects.filter(parser=parser.name).update(
+            ingested_hash=parser.content_hash, ingested_at=now
+        )
+
+    store_sources_status(True, any(source.changed for source in Source.objects.all()))
+
+
+def get_active_job():
+    # Jobs with attempt > 0 retry failed sources in the background and aren't shown.
+    return CrawlJob.objects.filter(status__in=CrawlJob.ACTIVE_STATUSES, attempt=0).first()
+
+
+def enqueue_crawl():
+    # A queued retry is turned into a full crawl that runs right away.
+    CrawlJob.objects.filter(status=CrawlJob.PENDING, attempt__gt=0).update(parsers='', attempt=0, run_after=None)
+    job = get_active_job()
+
+    if job:
+        return job
+
+    try:
+        with transaction.atomic():
+            return CrawlJob.objects.create()
+    except IntegrityError:
+        return get_active_job()
+
+
+def enqueue_retry(job, failed):
+    attempt = job.attempt + 1
+
+    if attempt > settings.CRAWL_JOB_RETRIES:
+        logger.debug(f'Crawl job {job.pk}: no retries left for {", ".join(failed)}.')
+        return None
+
+    run_after = timezone.now() + timedelta(seconds=backoff_delay(job.attempt, settings.CRAWL_JOB_RETRY_DELAY))
+
+    try:
+        with transaction.atomic():
+            return CrawlJob.objects.create(parsers=','.join(failed), attempt=attempt, run_after=run_after)
+    except IntegrityError:
+        pending = CrawlJob.objects.get(status=CrawlJob.PENDING)
+
+    # A full crawl is queued already and will cover the failed sources, another retry is extended.
+    if pending.attempt:
+        pending.parsers = ','.join(dict.fromkeys(pending.parser_names + list(failed)))
+        pending.save(update_fields=['parsers'])
+
+    return pending
+
+
+def claim_job():
+    with transaction.atomic():
+        job = CrawlJob.objects.select_for_update(skip_locked=True).filter(
+            Q(run_after__isnull=True) | Q(run_after__lte=timezone.now()),
+            status=CrawlJob.PENDING).order_by('created_at').first()
+
+        if job:
+            job.status = CrawlJob.RUNNING
+            job.started_at = timezone.now()
+            job.save(update_fields=['status', 'started_at'])
+
+    return job
+
+
+def fail_interrupted_jobs():
+    return CrawlJob.objects.filter(status=CrawlJob.RUNNING).update(
+        status=CrawlJob.FAILED, finished_at=timezone.now(), error='Interrupted'
+    )
+
+
+def run_job(job):
+    logger.debug(f'Running crawl job {job.pk}.')
+    crawler = AsyncCrawler(*get_parsers(job.parser_names))
+    ingest_timings = Timings()
+
+    try:
+        parsers, failed = crawler.crawl()
+
+        if failed and len(failed) == len(crawler.parsers):
+            job.status = CrawlJob.FAILED
+        else:
+            # Sources parsed successfully are ingested even if others failed.
+            with ingest_timings.span('ingest', profile=True):
+                result = update_records(parsers)
+            mark_ingested(parsers)
+            # The data version was bumped before the snapshots existed, and history may be cached under it.
+            if take_snapshots(job):
+                bump_data_version()
+            cache.get_or_set('initialized', True)
+            job.status = CrawlJob.PARTIAL if failed else CrawlJob.DONE
+            job.inserted, job.updated, job.unchanged, job.deleted = result
+
+        if failed:
+            logger.debug(f'Crawl job {job.pk} failed for {", ".join(failed)}.')
+            job.error = '\n'.join(f'{name}: {error!r}' for name, error in failed.items())
+    except Exception as e:
+        # The worker must keep polling; the job is failed instead of being left running.
+        logger.exception(f'Crawl job {job.pk} failed.')
+        job.status = CrawlJob.FAILED
+        job.error = repr(e)
+        failed = {}
+
+    job.finished_at = timezone.now()
+    job.save()
+    store_timings(job, [parser.timings for parser in crawler.parsers] + [ingest_timings])
+
+    # Only network errors may pass on their own; a broken spec or document would fail every retry the same way.
+    retryable = [name for name, error in failed.items() if isinstance(error, (ClientError, asyncio.TimeoutError))]
+    if retryable:
+        enqueue_retry(job, retryable)
+
+    logger.debug(f'Crawl job {job.pk} finished with status {job.status}.')
+    return job
+
+
+def store_timings(job, timings):
+    TimingSpan.objects.bulk_create(
+        TimingSpan(job=job, **span._asdict()) for parser_timings in timings for span in parser_timings.spans
+    )
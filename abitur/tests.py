@@ -1,13 +1,40 @@
+import asyncio
 import os
+import re
+import sqlite3
+import time
+from concurrent import futures
+from datetime import date
+from hashlib import sha256
+from io import StringIO
+from tempfile import TemporaryDirectory
 from unittest import TestCase, TestSuite
 from unittest.mock import patch, MagicMock
 
+from aiohttp import ClientConnectionError
+from asgiref.testing import ApplicationCommunicator
+
+from django.core.cache import cache
 from django.urls import reverse
 
-from abitur.models import Student
-from abitur.parsers import PirogovaParser, SechenovaParser, SechenovaBVIParser
+from abitur.cache_backends import SQLiteCache
+from abitur.crawler import AsyncCrawler, CrawlResult
+from abitur.extraction import get_backend
+from abitur.management.commands import crawl_worker, poll_sources
+from abitur.management.commands.benchmark_parsers import scale_tables
+from abitur.management.commands.load_test import percentile
+from abitur.pdfcache import PDFCache
+from abitur.models import Student, School, CrawlJob, Overlap, ParserSpec, Source, PIROGOVA, SECHENOVA, student_counts
+from abitur.parsers import get_parsers, make_parser, split_pages
+from abitur.pool import WorkerPool
+from abitur.tasks import refresh_sources, claim_job, get_active_job, run_job
+from abitur.utils import update_records, update_flag, normalize_name, take_snapshots, pack_ids, unpack_ids
+from abitur.views import AbiturView
+from snailchen.asgi import application
 from django.conf import settings
-from django.test import TestCase as DjangoTestCase
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError
+from django.test import TestCase as DjangoTestCase, override_settings
 from json import load
 
 
@@ -18,13 +45,81 @@ def mock_pdf(data):
     return mock
 
 
+def get_parser(name):
+    return make_parser(ParserSpec.objects.select_related('school').get(name=name))
+
+
+class SQLiteCacheTest(TestCase):
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {'OPTIONS': {'MAX_ENTRIES': 3, 'ACCESS_INTERVAL': 0}})
+
+    def test_set_get_incr(self):
+        self.cache.set('key', 1)
+        self.assertEqual(self.cache.incr('key'), 2)
+        self.assertEqual(self.cache.get('key'), 2)
+        self.assertFalse(self.cache.add('key', 5))
+        self.assertRaises(ValueError, self.cache.incr, 'missing')
+
+    def test_expired_entries_are_missing(self):
+        self.cache.set('key', 'value', timeout=-1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'value'))
+
+    def test_least_recently_used_are_evicted(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, key)
+            time.sleep(0.01)
+        self.cache.get('a')
+        self.cache.set('d', 'd')
+
+        self.assertEqual(self.cache.get('a'), 'a')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('d'), 'd')
+
+    def test_falls_back_when_file_is_not_usable(self):
+        params = {'OPTIONS': {'FALLBACK': 'default'}}
+        broken_cache = SQLiteCache('/dev/null/cache.sqlite3', params)
+
+        with patch('abitur.cache_backends.caches') as mock_caches, self.assertLogs('abitur.cache_backends'):
+            broken_cache.set('key', 'value')
+
+            broken_cache.get('key')
+
+        mock_caches['default'].set.assert_called_once_with('key', 'value')
+        mock_caches['default'].get.assert_called_once_with('key')
+
+    def test_locked_file_does_not_fall_back(self):
+        cache = SQLiteCache(self.location, {'OPTIONS': {'FALLBACK': 'default'}})
+
+        with patch.object(SQLiteCache, 'connect', side_effect=sqlite3.OperationalError('database is locked')), \
+                patch('abitur.cache_backends.caches') as mock_caches:
+            self.assertRaises(sqlite3.OperationalError, cache.set, 'key', 'value')
+
+        cache.set('key', 'value')
+        self.assertEqual(cache.get('key'), 'value')
+        mock_caches['default'].set.assert_not_called()
+
+    def test_reads_record_access_sparingly(self):
+        cache = SQLiteCache(self.location, {'OPTIONS': {'ACCESS_INTERVAL': 60}})
+        cache.set('key', 'value')
+        accessed = cache.connection.execute('SELECT accessed FROM cache').fetchone()[0]
+        time.sleep(0.01)
+        cache.get('key')
+
+        self.assertEqual(cache.connection.execute('SELECT accessed FROM cache').fetchone()[0], accessed)
+
+
 class ParserTestCase(TestCase):
     app = 'abitur'
     fixtures_dir = 'fixtures'
     file_name = ''
     page_name = ''
     data_name = ''
-    parser_class = None
+    spec_name = ''
     expected_source = ''
 
     @classmethod
@@ -33,7 +128,7 @@ class ParserTestCase(TestCase):
         page_path = os.path.join(settings.BASE_DIR, cls.app, cls.fixtures_dir, cls.page_name)
         data_path = os.path.join(settings.BASE_DIR, cls.app, cls.fixtures_dir, cls.data_name)
 
-        cls.parser = cls.parser_class()
+        cls.parser = get_parser(cls.spec_name)
 
         with open(file_path, 'rb') as file:
             cls.file = file.read()
@@ -46,6 +141,36 @@ class ParserTestCase(TestCase):
 
         cls.parser._page = cls.page
 
+    @patch('abitur.parsers.get_page_hashes')
+    @patch('abitur.parsers.extract_tables')
+    def test_extract_file_keeps_page_order(self, mock_extract_tables, mock_page_hashes):
+        mock_page_hashes.return_value = {page: str(page) for page in range(1, len(self.data) + 1)}
+        mock_extract_tables.side_effect = lambda _, pages, __: [self.data[int(page) - 1] for page in pages.split(',')]
+
+        with futures.ThreadPoolExecutor(max_workers=4) as executor, TemporaryDirectory() as cache_dir, \
+                override_settings(PDF_CACHE_DIR=cache_dir):
+            file = asyncio.run(self.parser.extract_file('list.pdf', executor))
+            tables = [table.data for table in file]
+
+        self.assertEqual(tables, self.data)
+
+    def test_scaled_tables_keep_categories(self):
+        parser, scaled_parser = get_parser(self.spec_name), get_parser(self.spec_name)
+        parser.parse_tables(mock_pdf(self.data))
+        scaled_parser.parse_tables(scale_tables(parser, mock_pdf(self.data), 3))
+
+        for name, category in parser.categories.items():
+            self.assertEqual(len(scaled_parser.categories[name]), len(category) * 3)
+
+    def test_vectorized_parse_matches_rows(self):
+        parser, rows_parser = get_parser(self.spec_name), get_parser(self.spec_name)
+        rows_parser.parse_tables(mock_pdf(self.data))
+        with override_settings(PARSE_VECTORIZED=True):
+            parser.parse_tables(mock_pdf(self.data))
+
+        self.assertEqual(parser._raw_categories, rows_parser._raw_categories)
+        self.assertEqual(list(parser), list(rows_parser))
+
     def test_get_source(self):
         self.parser.get_source()
 
@@ -53,22 +178,286 @@ class ParserTestCase(TestCase):
             self.parser.source_url, self.expected_source, 'get_source returns correct source url'
         )
 
-    @patch('abitur.parsers.PirogovaParser.get_source')
-    @patch('abitur.parsers.read_pdf')
-    def test_get_file(self, mock_read_pdf, _):
-        mock_read_pdf.return_value = self.file
-        file = self.parser.get_file()
+    @patch('abitur.parsers.get_page_hashes')
+    @patch('abitur.parsers.extract_tables')
+    def test_run(self, mock_extract_tables, mock_page_hashes):
+        mock_page_hashes.return_value = {1: '1'}
+        mock_extract_tables.return_value = self.data
+        session = MagicMock()
+        session.get.return_value = FakeResponse(200, self.file, {'ETag': '"1"'})
+        parser, rerun_parser = get_parser(self.spec_name), get_parser(self.spec_name)
+        parser._page = rerun_parser._page = self.page
+
+        with futures.ThreadPoolExecutor(max_workers=1) as executor, TemporaryDirectory() as cache_dir, \
+                override_settings(PDF_CACHE_DIR=cache_dir):
+            asyncio.run(parser.run(session, executor))
+            session.get.return_value = FakeResponse(304)
+            asyncio.run(rerun_parser.run(session, executor))
+
+        expected = get_parser(self.spec_name)
+        expected.parse_tables(mock_pdf(self.data))
+        self.assertEqual(list(parser), list(expected), 'run parses the extracted tables')
+        self.assertEqual(session.get.call_args[1]['headers'], {'If-None-Match': '"1"'})
+        self.assertEqual(list(rerun_parser), list(parser), 'unchanged file is read from cache')
+        self.assertEqual(mock_extract_tables.call_count, 1, 'unchanged file is not extracted again')
+        self.assertEqual([span.stage for span in parser.timings.spans].count('resolve_source'), 1)
+
+
+class SplitPagesTest(TestCase):
+
+    def test_split_pages(self):
+        self.assertEqual(list(split_pages([1, 2, 3, 4, 5], 2)), ['1,2', '3,4', '5'])
+        self.assertEqual(list(split_pages([], 2)), [])
+
+
+class WorkerPoolTest(TestCase):
+
+    def test_pool_is_reused_and_recycled(self):
+        pool = WorkerPool(max_workers=1, max_tasks_per_child=2)
+        pool.recycle()
+        executor = pool._executor
+
+        try:
+            self.assertIsNotNone(pool.startup_time)
+            self.assertEqual(pool.submit(abs, -1).result(), 1)
+            pool.recycle()
+            self.assertIs(pool._executor, executor, 'pool is reused between crawls')
+
+            self.assertEqual(pool.submit(abs, -2).result(), 2)
+            pool.recycle()
+            self.assertIsNot(pool._executor, executor, 'pool is replaced after max tasks')
+        finally:
+            pool.shutdown()
+
+
+class AsgiTest(TestCase):
+
+    def test_asgi_application_serves_views(self):
+        async def request():
+            communicator = ApplicationCommunicator(application, {
+                'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'', 'headers': [],
+            })
+            await communicator.send_input({'type': 'http.request'})
+            return await communicator.receive_output(timeout=5)
+
+        response = asyncio.run(request())
+        self.assertEqual((response['type'], response['status']), ('http.response.start', 302))
+
+    def test_percentile(self):
+        latencies = [i / 100 for i in range(1, 101)]
+        self.assertEqual(percentile(latencies, 50), 0.51)
+        self.assertEqual(percentile(latencies, 99), 0.99)
+        self.assertEqual(percentile([], 99), 0)
+
+
+class FakeResponse:
+
+    def __init__(self, status, content=b'', headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self._content = content
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        pass
+
+    async def read(self):
+        return self._content
+
+
+class AsyncCrawlerTest(DjangoTestCase):
+
+    @override_settings(CRAWL_RETRIES=2, CRAWL_RETRY_BACKOFF=0)
+    @patch('abitur.crawler.AsyncCrawler._check_source')
+    @patch('abitur.parsers.SectionsParser.run')
+    @patch('abitur.parsers.ColumnsParser.run')
+    def test_failed_source_does_not_stop_others(self, mock_pirogova_run, mock_sechenova_run, mock_check_source):
+        mock_check_source.return_value = Source(content_hash='1')
+        mock_pirogova_run.side_effect = [ClientConnectionError(), 'parsed']
+        mock_sechenova_run.side_effect = ClientConnectionError()
+        crawler = AsyncCrawler(get_parser('PirogovaParser'), get_parser('SechenovaParser'))
+
+        parsers, failed = asyncio.run(crawler._crawl(None))
+
+        self.assertEqual(parsers, ['parsed'], 'source is parsed after a retry')
+        self.assertEqual(list(failed), ['SechenovaParser'])
+        self.assertEqual(mock_sechenova_run.call_count, 3)
+
+    @override_settings(CRAWL_CONCURRENCY=2)
+    @patch('abitur.crawler.AsyncCrawler._check_source')
+    @patch('abitur.parsers.ColumnsParser.run')
+    def test_concurrency_is_limited(self, mock_run, mock_check_source):
+        running = []
+        most_running = []
+
+        async def run(*_):
+            running.append(1)
+            most_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+        mock_check_source.return_value = Source(content_hash='1')
+        mock_run.side_effect = run
+        crawler = AsyncCrawler(*[get_parser('PirogovaParser') for _ in range(5)])
+        asyncio.run(crawler._crawl(None))
+
+        self.assertEqual(mock_run.call_count, 5)
+        self.assertEqual(max(most_running), 2)
+
+    def test_parsers_are_built_from_active_specs(self):
+        ParserSpec.objects.filter(name='SechenovaBVIParser').update(is_active=False)
+
+        self.assertCountEqual([parser.name for parser in get_parsers()], ['PirogovaParser', 'SechenovaParser'])
+        self.assertEqual([parser.name for parser in get_parsers(['SechenovaParser'])], ['SechenovaParser'])
+
+    def test_spec_validation(self):
+        for spec in ParserSpec.objects.all():
+            spec.full_clean()
+
+        spec = ParserSpec.objects.get(name='SechenovaParser')
+        spec.name_column, spec.categories = 'ФИО', 'general, contrakt'
+
+        with self.assertRaises(ValidationError) as error:
+            spec.full_clean()
+        self.assertCountEqual(error.exception.message_dict, ['name_column', 'categories'])
+
+
+class CheckFileTest(TestCase):
+
+    def setUp(self):
+        self.parser = get_parser('PirogovaParser')
+        self.parser.source_url = 'http://example.com/list.pdf'
+        self.session = MagicMock()
+        cache_dir = TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.pdf_cache = PDFCache(cache_dir.name)
+        settings_override = override_settings(PDF_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def check(self, source):
+        return asyncio.run(self.parser.check_file(self.session, source))
+
+    def test_new_content_is_hashed(self):
+        self.session.get.return_value = FakeResponse(200, b'pdf', {'ETag': '"1"'})
+        source = self.check(Source())
+
+        self.assertEqual(source.content_hash, sha256(b'pdf').hexdigest())
+        self.assertEqual(source.etag, '"1"')
+        self.assertTrue(source.changed)
+        self.assertEqual([span.stage for span in self.parser.timings.spans], ['download_pdf'])
+
+    def test_checked_file_is_not_downloaded_again(self):
+        self.session.get.return_value = FakeResponse(200, b'pdf', {'ETag': '"1"'})
+        self.parser.content_hash = self.check(Source()).content_hash
+        content_hash = asyncio.run(self.parser.fetch_file(self.session, self.pdf_cache))
+
+        self.assertEqual(content_hash, self.parser.content_hash)
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_not_modified(self):
+        source = Source(url=self.parser.source_url, etag='"1"', content_hash='1', ingested_hash='1')
+        self.session.head.return_value = FakeResponse(200, headers={'ETag': '"2"'})
+        self.session.get.return_value = FakeResponse(304)
+        source = self.check(source)
+
+        self.assertEqual(self.session.get.call_args[1]['headers'], {'If-None-Match': '"1"'})
+        self.assertFalse(source.changed)
+
+    def test_head_matches_stored_validators(self):
+        source = Source(url=self.parser.source_url, etag='"1"', content_hash='1', ingested_hash='1')
+        self.session.head.return_value = FakeResponse(200, headers={'ETag': '"1"'})
+        self.check(source)
+
+        self.session.get.assert_not_called()
+
+    def test_changed_pdf_replaces_the_old_one(self):
+        old_hash = self.pdf_cache.store(self.parser.source_url, b'old')
+        new_hash = self.pdf_cache.store(self.parser.source_url, b'new')
+
+        self.assertFalse(os.path.exists(self.pdf_cache.pdf_path(old_hash)))
+        self.assertTrue(os.path.exists(self.pdf_cache.pdf_path(new_hash)))
+
+    def test_unread_pages_are_pruned(self):
+        self.pdf_cache.store_page('old', 'camelot', [])
+        self.pdf_cache.store_page('read', 'camelot', [])
+        hour_ago = time.time() - 3600
+        for page_hash in ('old', 'read'):
+            os.utime(os.path.join(self.pdf_cache.directory, f'page-{page_hash}-camelot.json.gz'), (hour_ago, hour_ago))
+
+        self.pdf_cache.load_page('read', 'camelot')
+        self.pdf_cache.prune_pages(60)
 
-        self.assertEqual(file, self.file, 'get_file returns a file produced by read_pdf')
+        self.assertIsNone(self.pdf_cache.load_page('old', 'camelot'))
+        self.assertEqual(self.pdf_cache.load_page('read', 'camelot'), [])
 
 
 class PirogovaParserTest(ParserTestCase):
     file_name = 'pirogova_list.pdf'
     page_name = 'pirogova_page.html'
     data_name = 'pirogova_data.json'
-    parser_class = PirogovaParser
+    spec_name = 'PirogovaParser'
     expected_source = 'http://rsmu.ru/fileadmin/rsmu/img/abiturients/2020/03_07_2020_biologija.pdf'
 
+    @patch('abitur.parsers.get_page_hashes')
+    @patch('abitur.parsers.extract_tables')
+    def test_invalid_extraction_falls_back(self, mock_extract_tables, mock_page_hashes):
+        mock_page_hashes.return_value = {1: '1'}
+        broken = [[['1', 'Трифонова Юлия Сергеевна', '202001087', 'призеры ОШ']]]
+        mock_extract_tables.side_effect = lambda _, __, backend: broken if backend == 'pdfminer' else self.data
+        parser = get_parser(self.spec_name)
+
+        with futures.ThreadPoolExecutor(max_workers=1) as executor, TemporaryDirectory() as cache_dir, \
+                override_settings(PDF_CACHE_DIR=cache_dir):
+            file = asyncio.run(parser.extract_file('list.pdf', executor))
+            tables = [table.data for table in file]
+
+        self.assertEqual(tables, self.data)
+
+    @patch('abitur.parsers.get_page_hashes')
+    @patch('abitur.parsers.extract_tables')
+    def test_broken_numbering_is_not_valid(self, mock_extract_tables, mock_page_hashes):
+        mock_page_hashes.return_value = {1: '1'}
+        missing_row = [table[:] for table in self.data]
+        del missing_row[4][5]
+        mock_extract_tables.side_effect = lambda _, __, backend: missing_row if backend == 'pdfminer' else self.data
+        parser = get_parser(self.spec_name)
+
+        self.assertFalse(parser.validate(mock_pdf(missing_row)))
+
+        with futures.ThreadPoolExecutor(max_workers=1) as executor, TemporaryDirectory() as cache_dir, \
+                override_settings(PDF_CACHE_DIR=cache_dir):
+            file = asyncio.run(parser.extract_file('list.pdf', executor))
+            self.assertEqual([table.data for table in file], self.data)
+            self.assertIsNone(PDFCache(cache_dir).load_page('1', 'pdfminer'), 'invalid tables are not cached')
+
+            mock_extract_tables.side_effect = lambda *_: missing_row
+            PDFCache(cache_dir).remove_page('1', 'camelot')
+            with self.assertRaises(ValueError):
+                asyncio.run(parser.extract_file('list.pdf', executor))
+            self.assertIsNone(PDFCache(cache_dir).load_page('1', 'camelot'))
+
+    @patch('abitur.parsers.get_page_hashes')
+    @patch('abitur.parsers.extract_tables')
+    def test_only_changed_pages_are_extracted(self, mock_extract_tables, mock_page_hashes):
+        mock_extract_tables.side_effect = lambda _, page, __: [self.data[int(page) - 1]]
+        parser = get_parser(self.spec_name)
+
+        with futures.ThreadPoolExecutor(max_workers=1) as executor, TemporaryDirectory() as cache_dir, \
+                override_settings(PDF_CACHE_DIR=cache_dir):
+            mock_page_hashes.return_value = {1: 'a', 2: 'b', 3: 'c'}
+            asyncio.run(parser.extract_pages('list.pdf', executor, 'pdfminer'))
+            mock_extract_tables.reset_mock()
+
+            mock_page_hashes.return_value = {1: 'a', 2: 'b', 3: 'changed', 4: 'd'}
+            file = asyncio.run(parser.extract_pages('list.pdf', executor, 'pdfminer'))
+            tables = [table.data for table in file]
+
+        self.assertEqual([call.args[1] for call in mock_extract_tables.call_args_list], ['3', '4'])
+        self.assertEqual(tables, self.data[:4])
+
     def test_parse_tables(self):
         pdf_mock = mock_pdf(self.data)
         self.parser.parse_tables(pdf_mock)
@@ -83,11 +472,23 @@ class PirogovaParserTest(ParserTestCase):
         self.assertEqual(len(self.parser.categories['general']), expected_others)
 
 
+class PdfminerBackendTest(TestCase):
+
+    def test_matches_camelot_lattice(self):
+        path = os.path.join(settings.BASE_DIR, 'abitur', 'fixtures', 'pirogova_list.pdf')
+        data_path = os.path.join(settings.BASE_DIR, 'abitur', 'fixtures', 'pirogova_data.json')
+
+        with open(data_path) as data:
+            expected = load(data)
+
+        self.assertEqual(get_backend('pdfminer').extract(path, 'all'), expected)
+
+
 class SechenovaParserTest(ParserTestCase):
     file_name = 'sechenova_list.pdf'
     page_name = 'sechenova_page.html'
     data_name = 'sechenova_data.json'
-    parser_class = SechenovaParser
+    spec_name = 'SechenovaParser'
     expected_source = 'https://www.sechenov.ru/upload/iblock/d62/' \
                       'Bakalavriat_-spetsialitet-_-spisok-lits-podavshikh-dokumenty.pdf'
 
@@ -107,7 +508,7 @@ class SechenovaBVIParserTest(ParserTestCase):
     file_name = 'sechenova_bvi_list.pdf'
     page_name = 'sechenova_page.html'
     data_name = 'sechenova_bvi_data.json'
-    parser_class = SechenovaBVIParser
+    spec_name = 'SechenovaBVIParser'
     expected_source = 'https://www.sechenov.ru/upload/iblock/5b9/' \
                       'Bakalavriat_-spetsialitet-_-spisok-lits-podavshikh-dokumenty-bez-VI.pdf'
 
@@ -119,7 +520,14 @@ class SechenovaBVIParserTest(ParserTestCase):
         self.assertEqual(len(self.parser), expected_total)
 
 
-class ViewTests(DjangoTestCase):
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CacheTestCase(DjangoTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+
+class ViewTests(CacheTestCase):
     fixtures = ['students.json']
 
     def test_abitur_view(self):
@@ -128,6 +536,19 @@ class ViewTests(DjangoTestCase):
 
         self.assertEqual(response.status_code, 200)
 
+    @patch('abitur.tasks.AsyncCrawler')
+    def test_abitur_view_reads_stored_sources(self, mock_crawler):
+        mock_crawler.return_value.check_sources.return_value = [Source(content_hash='1', ingested_hash='1')]
+        refresh_sources()
+        cache.set('initialized', True)
+        path = reverse('abitur')
+
+        with patch('abitur.crawler.AsyncCrawler.check_sources') as mock_check_sources:
+            response = self.client.get(path)
+
+        mock_check_sources.assert_not_called()
+        self.assertContains(response, AbiturView.alert_text_ok)
+
     def test_check_view(self):
         path = reverse('check-student')
         student = Student.objects.first()
@@ -148,8 +569,424 @@ class ViewTests(DjangoTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(not before_check)
 
+    @override_settings(STUDENTS_PAGE_SIZE=2)
+    def test_students_view_pages_through_all(self):
+        path = reverse('students')
+        params = {'period': 'all'}
+        pages = []
+
+        while True:
+            page = self.client.get(path, params).json()
+            pages.append(page['html'])
+            if not page['next']:
+                break
+            params['cursor'] = page['next']
+
+        ids = [int(i) for html in pages for i in re.findall(r'id="check(\d+)"', html)]
+        expected = list(Student.objects.order_by('-application_date', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(pages), (len(expected) + 1) // 2)
+
+    def test_students_view_rejects_bad_cursor(self):
+        response = self.client.get(reverse('students'), {'cursor': 'bad'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_abitur_view_caches_table_until_data_changes(self):
+        cache.set('initialized', True)
+        path = reverse('abitur')
+        student = Student.objects.first()
+
+        with patch('abitur.views.student_counts', wraps=student_counts) as mock_counts:
+            self.client.get(path, {'period': 'all'})
+            self.client.get(path, {'period': 'all'})
+            self.assertEqual(mock_counts.call_count, 1)
+
+            self.client.post(reverse('olympics-winner'), data={'student_id': student.id},
+                             content_type='application/json')
+            response = self.client.get(path, {'period': 'all'})
+            self.assertEqual(mock_counts.call_count, 2)
+
+        self.assertContains(response, 'student-winner')
+
+    def test_toggles_are_single_updates(self):
+        student = Student.objects.first()
+        winner_path, check_path = reverse('olympics-winner'), reverse('check-student')
+
+        with self.assertNumQueries(1):
+            states = update_flag('is_winner', [student.id])
+        self.assertEqual(states, {student.id: not student.is_winner})
+
+        first = self.client.post(winner_path, data={'student_id': student.id}, content_type='application/json')
+        second = self.client.post(winner_path, data={'student_id': student.id}, content_type='application/json')
+        self.assertEqual(first.json()['is_winner'], student.is_winner)
+        self.assertEqual(second.json()['is_winner'], not student.is_winner)
+
+        for tag, expected in (('a', True), ('a', True), ('i', False)):
+            response = self.client.post(check_path, data={'student_id': student.id, 'tag': tag},
+                                        content_type='application/json')
+            self.assertEqual(response.json()['is_checked'], expected)
+
+    def test_toggle_errors(self):
+        path = reverse('olympics-winner')
+
+        missing = self.client.post(path, data={'student_id': 0}, content_type='application/json')
+        malformed = self.client.post(path, data='{', content_type='application/json')
+
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(malformed.status_code, 400)
+
+    def test_batch_marks(self):
+        path = reverse('olympics-batch')
+        ids = list(Student.objects.values_list('id', flat=True)[:3])
+        payload = {'field': 'is_checked', 'student_ids': ids + [0], 'value': True}
+        response = self.client.post(path, data=payload, content_type='application/json')
+
+        self.assertEqual(response.json()['students'], {str(pk): True for pk in ids})
+        self.assertEqual(Student.objects.filter(is_checked=True).count(), 3)
+
+        payload = {'field': 'is_superuser', 'student_ids': ids}
+        self.assertEqual(self.client.post(path, data=payload, content_type='application/json').status_code, 400)
+
+        payload = {'field': 'is_winner', 'student_ids': ''.join(str(pk) for pk in ids)}
+        self.assertEqual(self.client.post(path, data=payload, content_type='application/json').status_code, 400)
+        self.assertFalse(Student.objects.filter(is_winner=True).exists())
+
+    def test_student_counts(self):
+        students = Student.objects.all()
+
+        with self.assertNumQueries(1):
+            counts = student_counts(students)
+
+        self.assertEqual(counts['total_count'], students.count())
+        self.assertEqual(counts['sech_count'], students.filter(school__name=SECHENOVA).count())
+        self.assertEqual(counts['pirogova_bvi_count'], students.filter(school__name=PIROGOVA, bvi=True).count())
+
+
+class UpdateRecordsTests(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.school = School.objects.get(name=PIROGOVA)
+        self.spec = ParserSpec.objects.get(name='PirogovaParser')
+
+    def make_student(self, name, funded_only=False, spec=None):
+        return dict(
+            name=name,
+            bvi=False,
+            application_date=date(2020, 7, 1),
+            school=self.school,
+            spec=spec or self.spec,
+            funded_only=funded_only
+        )
+
+    def make_parser(self, spec):
+        parser = MagicMock()
+        parser.__iter__.side_effect = lambda: iter(parser.students)
+        parser.scope = spec
+        return parser
+
+    def test_inserts_new_students(self):
+        parsed = [self.make_student('Иванов Иван'), self.make_student('Петров Петр')]
+        result = update_records([parsed])
+
+        self.assertEqual(result, (2, 0, 0, 0))
+        self.assertEqual(Student.objects.count(), 2)
+
+    def test_repeated_ingest_is_unchanged(self):
+        parsed = [self.make_student('Иванов Иван'), self.make_student('Петров Петр')]
+        update_records([parsed])
+        result = update_records([parsed])
+
+        self.assertEqual(result, (0, 0, 2, 0))
+        self.assertEqual(Student.objects.count(), 2)
+
+    def test_update_preserves_marks(self):
+        update_records([[self.make_student('Иванов Иван')]])
+        Student.objects.update(is_checked=True, is_winner=True)
+        result = update_records([[self.make_student('Иванов Иван', funded_only=True)]])
+        student = Student.objects.get()
+
+        self.assertEqual(result, (0, 1, 0, 0))
+        self.assertTrue(student.funded_only)
+        self.assertTrue(student.is_checked)
+        self.assertTrue(student.is_winner)
+
+    @patch('abitur.utils.BATCH_SIZE', 2)
+    def test_ingest_in_batches(self):
+        parsed = [self.make_student(name) for name in ('Иванов Иван', 'Петров Петр', 'Сидоров Сидор')]
+        update_records([parsed[:2]])
+        result = update_records([parsed, [self.make_student('Иванов Иван', funded_only=True)]])
+
+        self.assertEqual(result, (1, 1, 2, 0))
+        self.assertEqual(Student.objects.count(), 3)
+        self.assertTrue(Student.objects.get(name='Иванов Иван').funded_only)
+
+    def test_withdrawn_students_are_deleted(self):
+        parser = self.make_parser(self.spec)
+        other_school = School.objects.get(name=SECHENOVA)
+        Student.objects.create(**dict(self.make_student('Чужой Студент'), school=other_school, spec=None))
+        Student.objects.create(**dict(self.make_student('Бвиев Бви'), spec=None))
+
+        parser.students = [self.make_student(name) for name in ('Иванов Иван', 'Петров Петр', 'Сидоров Сидор')]
+        update_records([parser])
+        parser.students = parser.students[:2]
+        result = update_records([parser])
+
+        self.assertEqual(result, (0, 0, 2, 1))
+        self.assertFalse(Student.objects.filter(name='Сидоров Сидор').exists())
+        self.assertEqual(Student.objects.count(), 4)
+
+    def test_lists_of_one_school_are_kept_apart(self):
+        other_spec = ParserSpec.objects.create(**dict(
+            ParserSpec.objects.filter(pk=self.spec.pk).values().get(), id=None, name='PirogovaOtherParser'
+        ))
+        parser, other_parser = self.make_parser(self.spec), self.make_parser(other_spec)
+        parser.students = [self.make_student(name) for name in ('Иванов Иван', 'Петров Петр', 'Сидоров Сидор')]
+        other_parser.students = [self.make_student(name, spec=other_spec) for name in ('Иванов Иван', 'Козлов Олег')]
+        update_records([parser, other_parser])
+        Student.objects.filter(spec=other_spec).update(is_winner=True)
+        result = update_records([parser])
+
+        self.assertEqual(result, (0, 0, 3, 0))
+        self.assertEqual(Student.objects.filter(name='Иванов Иван').count(), 2, 'applications are kept apart')
+        self.assertEqual(Student.objects.filter(spec=other_spec, is_winner=True).count(), 2)
+
+    def test_mass_withdrawal_is_skipped(self):
+        parser = self.make_parser(self.spec)
+        parser.students = [self.make_student(name) for name in ('Иванов Иван', 'Петров Петр', 'Сидоров Сидор')]
+        update_records([parser])
+        parser.students = parser.students[:1]
+
+        with self.assertLogs('abitur.utils', 'WARNING'):
+            result = update_records([parser])
+
+        self.assertEqual(result.deleted, 0)
+        self.assertEqual(Student.objects.count(), 3)
+
+
+class OverlapTests(CacheTestCase):
+
+    def make_student(self, name, school_name):
+        return dict(
+            name=name,
+            bvi=False,
+            application_date=date(2020, 7, 1),
+            school=School.objects.get(name=school_name),
+            funded_only=False,
+        )
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name(' СЕМЁНОВ  Пётр\nИванович '), 'Семенов Петр Иванович')
+
+    def test_overlap_is_refreshed_on_ingest(self):
+        update_records([[self.make_student('Семёнов Петр', PIROGOVA), self.make_student('Иванов Иван', PIROGOVA)],
+                        [self.make_student('Семенов  Петр', SECHENOVA)]])
+
+        self.assertEqual(list(Overlap.objects.values_list('normalized_name', 'school_count')),
+                         [('Семенов Петр', 2)])
+
+        cache.set('initialized', True)
+        response = self.client.get(reverse('abitur'), {'period': 'all'})
+        self.assertContains(response, 'Есть в списках другого вуза', count=2)
+
+        Student.objects.filter(school__name=SECHENOVA).delete()
+        update_records([[self.make_student('Сидоров Сидор', SECHENOVA)]])
+
+        self.assertFalse(Overlap.objects.exists())
+
+
+class SnapshotTests(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.school = School.objects.get(name=PIROGOVA)
+
+    def add_students(self, *names):
+        return [
+            Student.objects.create(name=name, school=self.school, bvi=False, application_date=date(2020, 7, 1),
+                                   funded_only=True)
+            for name in names
+        ]
+
+    def test_pack_ids(self):
+        ids = [1, 2, 3, 10, 2 ** 40]
+        self.assertEqual(unpack_ids(pack_ids(ids)), ids)
+        self.assertEqual(unpack_ids(pack_ids([])), [])
+
+    def test_snapshots_are_taken_on_changes(self):
+        students = self.add_students('Иванов Иван', 'Петров Петр')
+        first, = take_snapshots()
+
+        self.assertEqual((first.school, first.total, first.funded_only, first.joined), (self.school, 2, 2, 2))
+        self.assertEqual(unpack_ids(first.student_ids), [student.pk for student in students])
+        self.assertEqual(take_snapshots(), [], 'unchanged students are not stored again')
+
+        students[0].delete()
+        self.add_students('Сидоров Сидор')
+        second, = take_snapshots()
+
+        self.assertEqual((second.total, second.joined, second.withdrawn), (2, 1, 1))
+
+    def test_history_view(self):
+        self.add_students('Иванов Иван')
+        take_snapshots()
+        self.add_students('Петров Петр')
+        take_snapshots()
+
+        history = self.client.get(reverse('history')).json()
+
+        self.assertEqual(len(history[PIROGOVA]), 1, 'one point per day')
+        self.assertEqual(history[PIROGOVA][0]['total'], 2)
+        self.assertEqual(history[PIROGOVA][0]['joined'], 2)
+
+
+class CrawlJobTests(CacheTestCase):
+
+    def test_update_view_enqueues_single_job(self):
+        path = reverse('update')
+        first = self.client.post(path, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        second = self.client.post(path, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(first.json()['id'], second.json()['id'])
+        self.assertEqual(CrawlJob.objects.count(), 1)
+
+    def test_status_view(self):
+        path = reverse('update-status')
+        self.assertEqual(self.client.get(path).json()['status'], None)
+
+        self.client.post(reverse('update'))
+        self.assertEqual(self.client.get(path).json()['status'], CrawlJob.PENDING)
+
+    @patch('abitur.tasks.AsyncCrawler')
+    def test_run_job(self, mock_crawler):
+        mock_crawler.return_value.crawl.return_value = CrawlResult([], {})
+        self.client.post(reverse('update'))
+        job = run_job(claim_job())
+
+        self.assertEqual(job.status, CrawlJob.DONE)
+        self.assertIsNone(claim_job())
+
+    @patch('abitur.tasks.AsyncCrawler')
+    def test_run_job_stores_timings(self, mock_crawler):
+        parser = get_parser('PirogovaParser')
+        mock_crawler.return_value.crawl.return_value = CrawlResult([parser], {})
+        mock_crawler.return_value.parsers = [parser]
+        self.client.post(reverse('update'))
+
+        with TemporaryDirectory() as profile_dir, override_settings(CRAWL_PROFILE_DIR=profile_dir):
+            parser.parse_tables(mock_pdf([]))
+            job = run_job(claim_job())
+            profiles = os.listdir(profile_dir)
+
+        stages = [(span.parser, span.stage) for span in job.spans.all()]
+        self.assertEqual(stages, [('PirogovaParser', 'parse_tables'), ('PirogovaParser', 'clean_categories'),
+                                  ('', 'ingest')])
+        self.assertEqual(len(profiles), 3)
+
+    @patch('abitur.tasks.AsyncCrawler')
+    def test_run_job_marks_sources_ingested(self, mock_crawler):
+        Source.objects.create(parser='PirogovaParser', content_hash='new', ingested_hash='old')
+        parser = get_parser('PirogovaParser')
+        parser.content_hash = 'new'
+        mock_crawler.return_value.crawl.return_value = CrawlResult([parser], {})
+        self.client.post(reverse('update'))
+        run_job(claim_job())
+
+        self.assertFalse(Source.objects.get(parser='PirogovaParser').changed)
+
+    @patch('abitur.tasks.AsyncCrawler')
+    def test_history_is_not_cached_before_snapshots(self, mock_crawler):
+        parser = get_parser('PirogovaParser')
+        with open(os.path.join(settings.BASE_DIR, 'abitur', 'fixtures', 'pirogova_data.json')) as data:
+            parser.parse_tables(mock_pdf(load(data)))
+        mock_crawler.return_value.crawl.return_value = CrawlResult([parser], {})
+        self.client.post(reverse('update'))
+        cached_history = []
+
+        def take_snapshots_after_request(job):
+            cached_history.append(self.client.get(reverse('history')).json())
+            return take_snapshots(job)
+
+        with patch('abitur.tasks.take_snapshots', side_effect=take_snapshots_after_request):
+            run_job(claim_job())
+
+        self.assertEqual(cached_history, [{}])
+        self.assertEqual(self.client.get(reverse('history')).json()[PIROGOVA][0]['total'], len(parser))
+
+    @patch('abitur.tasks.update_records')
+    @patch('abitur.tasks.AsyncCrawler')
+    def test_ingest_error_fails_job(self, mock_crawler, mock_update_records):
+        mock_crawler.return_value.crawl.return_value = CrawlResult([], {})
+        mock_update_records.side_effect = DatabaseError('connection lost')
+        self.client.post(reverse('update'))
+
+        with self.assertLogs('abitur.tasks', 'ERROR'):
+            job = run_job(claim_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, CrawlJob.FAILED)
+        self.assertIn('connection lost', job.error)
+        self.assertIsNone(get_active_job())
+
+    @patch('abitur.management.commands.poll_sources.close_old_connections')
+    @patch('abitur.management.commands.poll_sources.refresh_sources')
+    def test_poller_survives_database_errors(self, mock_refresh_sources, mock_close_old_connections):
+        mock_refresh_sources.side_effect = DatabaseError('connection already closed')
+        stderr = StringIO()
+        poll_sources.Command(stderr=stderr).poll({'once': True, 'interval': 0})
+
+        self.assertIn('connection already closed', stderr.getvalue())
+        mock_close_old_connections.assert_called_once_with()
+
+    @patch('abitur.management.commands.crawl_worker.close_old_connections')
+    @patch('abitur.management.commands.crawl_worker.claim_job')
+    def test_worker_survives_database_errors(self, mock_claim_job, mock_close_old_connections):
+        mock_claim_job.side_effect = DatabaseError('connection already closed')
+        stderr = StringIO()
+        crawl_worker.Command(stderr=stderr).run_jobs({'once': True, 'sleep': 0})
+
+        self.assertIn('connection already closed', stderr.getvalue())
+        mock_close_old_connections.assert_called_once_with()
+
+    @patch('abitur.tasks.AsyncCrawler')
+    def test_failed_sources_are_retried_in_background(self, mock_crawler):
+        parser = get_parser('PirogovaParser')
+        parser.parse_tables(mock_pdf([]))
+        mock_crawler.return_value.crawl.return_value = CrawlResult(
+            [parser], {'SechenovaParser': ClientConnectionError()}
+        )
+        mock_crawler.return_value.parsers = [parser, get_parser('SechenovaParser')]
+        self.client.post(reverse('update'))
+        job = run_job(claim_job())
+        retry = CrawlJob.objects.get(status=CrawlJob.PENDING)
+
+        self.assertEqual(job.status, CrawlJob.PARTIAL)
+        self.assertEqual((retry.parser_names, retry.attempt), (['SechenovaParser'], 1))
+        self.assertIsNone(claim_job(), 'retry waits for its backoff')
+        self.assertEqual(self.client.get(reverse('update-status')).json()['id'], job.pk)
+
+        self.client.post(reverse('update'))
+        retry.refresh_from_db()
+        self.assertEqual((retry.parser_names, retry.run_after), ([], None), 'update turns the retry into a crawl')
+
+    @patch('abitur.tasks.AsyncCrawler')
+    def test_deterministic_failures_are_not_retried(self, mock_crawler):
+        mock_crawler.return_value.crawl.return_value = CrawlResult(
+            [], {'PirogovaParser': ValueError("invalid literal for int() with base 10: 'a'")}
+        )
+        mock_crawler.return_value.parsers = [get_parser('PirogovaParser')]
+        self.client.post(reverse('update'))
+        job = run_job(claim_job())
+
+        self.assertEqual(job.status, CrawlJob.FAILED)
+        self.assertFalse(CrawlJob.objects.filter(status=CrawlJob.PENDING).exists())
+
 
-test_cases = (PirogovaParserTest, SechenovaParserTest, SechenovaBVIParserTest, ViewTests)
+test_cases = (SQLiteCacheTest, SplitPagesTest, WorkerPoolTest, AsgiTest, AsyncCrawlerTest, CheckFileTest,
+              PirogovaParserTest, PdfminerBackendTest, SechenovaParserTest, SechenovaBVIParserTest, ViewTests,
+              UpdateRecordsTests, OverlapTests, SnapshotTests, CrawlJobTests)
 
 
 def load_tests(loader, *_):
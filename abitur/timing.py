@@ -0,0 +1,62 @@
+import cProfile
+import os
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils import timezone
+
+
+Span = namedtuple('Span', 'parser stage started_at duration profile')
+
+
+class Timings:
+    """
+    Durations of the crawl stages of one parser.
+
+    With CRAWL_PROFILE_DIR set, stages opened with profile=True are also run
+    under cProfile and the stats are dumped there. Only synchronous code can
+    be profiled this way: a profiler enabled around an await would record
+    whatever else the event loop runs meanwhile.
+    """
+
+    def __init__(self, parser=''):
+        self.parser = parser
+        self.spans = []
+
+    @contextmanager
+    def span(self, stage, profile=False):
+        started_at = timezone.now()
+        start = time.perf_counter()
+        profile_path = self.profile_path(stage, started_at) if profile else ''
+        profiler = cProfile.Profile() if profile_path else None
+
+        if profiler:
+            profiler.enable()
+
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(profile_path)
+            self.spans.append(Span(self.parser, stage, started_at, time.perf_counter() - start, profile_path))
+
+    def profile_path(self, stage, started_at=None):
+        if not settings.CRAWL_PROFILE_DIR:
+            return ''
+
+        os.makedirs(settings.CRAWL_PROFILE_DIR, exist_ok=True)
+        started_at = started_at or timezone.now()
+        name = '-'.join(part for part in (f'{started_at:%Y%m%d-%H%M%S-%f}', self.parser, stage) if part)
+        return os.path.join(settings.CRAWL_PROFILE_DIR, f'{name}.prof')
+
+
+def run_profiled(profile_path, func, *args):
+    profiler = cProfile.Profile()
+
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        profiler.dump_stats(profile_path)
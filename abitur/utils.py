@@ -1,10 +1,32 @@
+import logging
+import zlib
+from array import array
+from collections import namedtuple
 from datetime import datetime
-from zlib import adler32
-from itertools import chain
+from itertools import accumulate, islice
 
+import pandas as pd
 from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
 
-from abitur.models import Student, School
+from abitur.models import Student, School, Snapshot, Source, Overlap
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+# Withdrawals are only applied if they don't remove more than this share of
+# a parser's students, so a broken extraction can't wipe the table.
+MAX_WITHDRAWN_SHARE = 0.5
+
+STUDENT_FLAGS = ('is_winner', 'is_checked')
+
+DATA_VERSION_KEY = 'data_version'
+
+IngestResult = namedtuple('IngestResult', 'inserted updated unchanged deleted')
 
 
 def find_funded(general, contract):
@@ -23,19 +45,299 @@ def table_rows(pdf_file, find_column_indices):
             yield row, name_index, date_index
 
 
+def table_frame(pdf_file, find_column_indices):
+    """Number, name and date columns of all tables in one DataFrame."""
+    frames = []
+
+    for table in pdf_file:
+        name_index, date_index = find_column_indices(table)
+        if not table.data:
+            continue
+
+        rows = pd.DataFrame(table.data)
+        frames.append(pd.DataFrame({'number': rows[0], 'name': rows.get(name_index), 'date': rows.get(date_index)}))
+
+    if not frames:
+        return pd.DataFrame(columns=['number', 'name', 'date'])
+
+    frame = pd.concat(frames, ignore_index=True)
+    frame['number'] = frame['number'].fillna('')
+    return frame
+
+
 def make_date(string):
-    return datetime.strptime(string, '%d.%m.%Y')
+    return datetime.strptime(string, '%d.%m.%Y').date()
+
+
+def make_dates(strings):
+    return pd.to_datetime(strings, format='%d.%m.%Y').dt.date
+
 
+def normalize_name(name):
+    return ' '.join(name.replace('ё', 'е').replace('Ё', 'Е').split()).lower().title()
 
-def make_checksum(link):
-    return str(adler32(link.encode()))
+
+def student_key(student):
+    spec = student.get('spec')
+    return student['name'], student['school'].pk, spec and spec.pk, student['application_date'], student['bvi']
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
 
 
 def update_records(parsers):
-    for student_dict in chain.from_iterable(parsers):
-        Student.objects.get_or_create(**student_dict)
+    inserted = updated = unchanged = deleted = 0
+
+    with transaction.atomic():
+        for parser in parsers:
+            seen = set()
+
+            for batch in batches(parser, BATCH_SIZE):
+                result = update_batch(batch, seen)
+                inserted += result.inserted
+                updated += result.updated
+                unchanged += result.unchanged
+
+            spec = getattr(parser, 'scope', None)
+            if spec and seen:
+                deleted += delete_withdrawn(spec, seen)
+
+        if inserted or deleted:
+            refresh_overlap()
+
+    if inserted or updated or deleted:
+        bump_data_version()
+
+    return IngestResult(inserted, updated, unchanged, deleted)
+
+
+def update_batch(students, seen):
+    parsed = {student_key(student): student for student in students}
+    seen.update(parsed)
+    names = {name for name, *_ in parsed}
+
+    existing = {}
+    rows = Student.objects.filter(name__in=names).order_by().values_list(
+        'pk', 'name', 'school_id', 'spec_id', 'application_date', 'bvi', 'funded_only'
+    )
+    for pk, *key, funded_only in rows:
+        existing.setdefault(tuple(key), (pk, funded_only))
+
+    new_students, changed_students = [], []
+
+    for key, student in parsed.items():
+        if key not in existing:
+            new_students.append(Student(normalized_name=normalize_name(student['name']), **student))
+            continue
+
+        pk, funded_only = existing[key]
+        if funded_only != student['funded_only']:
+            changed_students.append(Student(pk=pk, funded_only=student['funded_only']))
+
+    Student.objects.bulk_create(new_students)
+    Student.objects.bulk_update(changed_students, ['funded_only'])
+
+    unchanged = len(parsed) - len(new_students) - len(changed_students)
+    return IngestResult(len(new_students), len(changed_students), unchanged, 0)
+
+
+def delete_withdrawn(spec, seen):
+    rows = Student.objects.filter(spec=spec).order_by().values_list(
+        'pk', 'name', 'school_id', 'spec_id', 'application_date', 'bvi'
+    )
+    existing = 0
+    withdrawn = []
+
+    for pk, *key in rows:
+        existing += 1
+        if tuple(key) not in seen:
+            withdrawn.append(pk)
+
+    if len(withdrawn) > existing * MAX_WITHDRAWN_SHARE:
+        logger.warning(f'{len(withdrawn)} of {existing} students of {spec} are missing, withdrawals are skipped.')
+        return 0
+
+    for batch in batches(withdrawn, BATCH_SIZE):
+        Student.objects.filter(pk__in=batch).delete()
+
+    return len(withdrawn)
+
+
+def refresh_overlap():
+    """Store the names listed by more than one school, so the dashboard doesn't compare schools per request."""
+    current = dict(
+        Student.objects.exclude(normalized_name='').order_by().values('normalized_name').annotate(
+            school_count=Count('school', distinct=True)).filter(school_count__gt=1).values_list(
+            'normalized_name', 'school_count')
+    )
+    existing = {name: (pk, school_count) for pk, name, school_count in
+                Overlap.objects.values_list('pk', 'normalized_name', 'school_count')}
+
+    removed = [pk for name, (pk, _) in existing.items() if name not in current]
+    for batch in batches(removed, BATCH_SIZE):
+        Overlap.objects.filter(pk__in=batch).delete()
+
+    Overlap.objects.bulk_create(
+        (Overlap(normalized_name=name, school_count=school_count) for name, school_count in current.items()
+         if name not in existing),
+        batch_size=BATCH_SIZE,
+    )
+    Overlap.objects.bulk_update(
+        [Overlap(pk=existing[name][0], school_count=school_count) for name, school_count in current.items()
+         if name in existing and existing[name][1] != school_count],
+        ['school_count'],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def overlapping_names(students):
+    names = {student.normalized_name for student in students}
+    return set(Overlap.objects.filter(normalized_name__in=names).values_list('normalized_name', flat=True))
+
+
+def update_flag(field, student_ids, value=None):
+    """Set a mark of the students, or flip it when value is None, in one UPDATE.
+
+    Returns the new state of every updated student by id.
+    """
+    if field not in STUDENT_FLAGS:
+        raise ValueError(f'{field} is not a student flag')
+
+    if not student_ids:
+        return {}
+
+    column = connection.ops.quote_name(Student._meta.get_field(field).column)
+    table = connection.ops.quote_name(Student._meta.db_table)
+    new_value = f'NOT {column}' if value is None else '%s'
+    params = [] if value is None else [bool(value)]
+    placeholders = ', '.join(['%s'] * len(student_ids))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET {column} = {new_value} WHERE id IN ({placeholders}) RETURNING id, {column}',
+            params + list(student_ids)
+        )
+        return {pk: bool(state) for pk, state in cursor.fetchall()}
+
+
+def get_data_version():
+    return cache.get_or_set(DATA_VERSION_KEY, 1, None)
+
+
+def bump_data_version():
+    try:
+        cache.incr(DATA_VERSION_KEY)
+    except ValueError:
+        cache.set(DATA_VERSION_KEY, 1, None)
+
+
+def make_cursor(student):
+    return f'{student.application_date.isoformat()}_{student.pk}'
+
+
+def parse_cursor(cursor):
+    application_date, _, pk = cursor.partition('_')
+    return datetime.strptime(application_date, '%Y-%m-%d').date(), int(pk)
+
+
+def students_page(students, cursor=None, size=100):
+    if cursor:
+        application_date, pk = parse_cursor(cursor)
+        students = students.filter(
+            Q(application_date__lt=application_date) | Q(application_date=application_date, pk__lt=pk)
+        )
+
+    page = list(students.order_by('-application_date', '-pk')[:size + 1])
+    next_cursor = make_cursor(page[size - 1]) if len(page) > size else None
+
+    return page[:size], next_cursor
+
+
+def pack_ids(ids):
+    """Sorted ids as compressed deltas, mostly 1s, so a snapshot takes a few bytes per thousand students."""
+    deltas = array('Q', (current - previous for previous, current in zip([0] + ids, ids)))
+    return zlib.compress(deltas.tobytes())
+
+
+def unpack_ids(data):
+    deltas = array('Q')
+    deltas.frombytes(zlib.decompress(data))
+    return list(accumulate(deltas))
+
+
+def take_snapshots(job=None):
+    counts = {
+        row.pop('school'): row for row in Student.objects.order_by().values('school').annotate(
+            total=Count('pk'), bvi=Count('pk', filter=Q(bvi=True)), funded_only=Count('pk', filter=Q(funded_only=True))
+        )
+    }
+    snapshots = []
+
+    for school in School.objects.all():
+        student_ids = list(school.students.order_by('pk').values_list('pk', flat=True))
+        school_counts = counts.get(school.pk, dict(total=0, bvi=0, funded_only=0))
+        previous = school.snapshots.first()
+        previous_ids = set(unpack_ids(previous.student_ids)) if previous else set()
+        joined = len(set(student_ids) - previous_ids)
+        withdrawn = len(previous_ids - set(student_ids))
+
+        if previous is None and not student_ids:
+            continue
+        previous_counts = dict(total=previous.total, bvi=previous.bvi, funded_only=previous.funded_only) \
+            if previous else None
+        if not (joined or withdrawn) and previous_counts == school_counts:
+            continue
+
+        snapshots.append(Snapshot(job=job, school=school, joined=joined, withdrawn=withdrawn,
+                                  student_ids=pack_ids(student_ids), **school_counts))
+
+    return Snapshot.objects.bulk_create(snapshots)
+
+
+def snapshot_series():
+    """Counts of every school by day, from the last snapshot of the day."""
+    series = {}
+    snapshots = Snapshot.objects.order_by('created_at').values(
+        'school__name', 'created_at', 'total', 'bvi', 'funded_only', 'joined', 'withdrawn'
+    )
+
+    for snapshot in snapshots:
+        points = series.setdefault(snapshot.pop('school__name'), {})
+        day = timezone.localtime(snapshot.pop('created_at')).date().isoformat()
+        point = points.get(day)
+
+        if point:
+            snapshot['joined'] += point['joined']
+            snapshot['withdrawn'] += point['withdrawn']
+        points[day] = dict(date=day, **snapshot)
+
+    return {school: list(points.values()) for school, points in series.items()}
+
+
+def database_sync_to_async(func):
+    """sync_to_async for ORM calls, closing the executor thread's connection when it is broken or obsolete."""
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call)
+
+
+@database_sync_to_async
+def get_source_state(parser):
+    source, _ = Source.objects.get_or_create(parser=parser.name)
+    return source
 
 
-@sync_to_async
-def get_school(name):
-    return School.objects.get(name=name)
+@database_sync_to_async
+def save_source_state(source):
+    source.save()
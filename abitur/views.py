@@ -1,62 +1,74 @@
+from datetime import timedelta
+from hashlib import md5
 from json import loads, JSONDecodeError
 
-from aiohttp import ClientConnectionError
-from django.contrib import messages
+from django.conf import settings
 from django.core.cache import cache
-from django.shortcuts import render, redirect, HttpResponse, get_object_or_404
+from django.http import JsonResponse, Http404
+from django.shortcuts import render, redirect, HttpResponse
+from django.template.loader import render_to_string
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.views.generic import View, RedirectView
 
-from .crawler import AsyncCrawler
 from .forms import PeriodFilterForm
-from .models import Student, sech_count, pirogova_count, sech_bvi_count, sech_funded_only_count, \
-    pirogova_funded_only_count, pirogova_winners_count, sechenova_winners_count, pirogova_bvi_count
-from .utils import make_checksum, update_records
-from .parsers import parser_registry
+from .models import Student, CrawlJob, Overlap, student_counts
+from .tasks import get_sources, get_active_job, enqueue_crawl
+from .utils import (
+    students_page, get_data_version, bump_data_version, update_flag, batches, snapshot_series, overlapping_names,
+    BATCH_SIZE, STUDENT_FLAGS
+)
+
+
+def get_cached(key_parts, compute):
+    key_parts = (get_data_version(), *key_parts)
+    key = 'fragment-' + md5(':'.join(str(part) for part in key_parts).encode()).hexdigest()
+    value = cache.get(key)
+
+    if value is None:
+        value = compute()
+        cache.set(key, value, settings.FRAGMENT_CACHE_TIMEOUT)
+
+    return value
 
 
 class AjaxWinnerView(View):
+    field = 'is_winner'
 
     def post(self, request, *args, **kwargs):
         data = self.decode_request()
-        self.update_student(data)
-        return HttpResponse(status=200)
 
-    def update_student(self, data):
-        student = self.get_student(data)
+        try:
+            student_id = int(data['student_id'])
+        except (TypeError, KeyError, ValueError):
+            return HttpResponse(status=400)
 
-        if student.is_winner:
-            student.is_winner = False
-        else:
-            student.is_winner = True
+        states = update_flag(self.field, [student_id], self.get_value(data))
+        if not states:
+            raise Http404()
+
+        bump_data_version()
+        return JsonResponse({'student_id': student_id, self.field: states[student_id]})
 
-        student.save()
+    def get_value(self, data):
+        return None
 
     def decode_request(self):
         try:
             data = loads(self.request.body)
         except JSONDecodeError:
-            return HttpResponse(status=400)
+            return None
         return data
 
-    @staticmethod
-    def get_student(data):
-        student_id = data.get('student_id')
-        student = get_object_or_404(Student, pk=student_id)
-        return student
-
 
 class AjaxCheckedView(AjaxWinnerView):
+    field = 'is_checked'
 
-    def update_student(self, data):
-        student = self.get_student(data)
-        tag = self.get_tag(data)
-
-        if student.is_checked and tag == 'i':
-            student.is_checked = False
-        else:
-            student.is_checked = True
-        student.save()
+    def get_value(self, data):
+        # Clicking the icon flips the mark, following the link only sets it.
+        if self.get_tag(data) == 'i':
+            return None
+        return True
 
     @staticmethod
     def get_tag(data):
@@ -64,28 +76,55 @@ class AjaxCheckedView(AjaxWinnerView):
         return tag
 
 
-class UpdateView(View):
+class AjaxBatchMarkView(AjaxWinnerView):
+
     def post(self, request, *args, **kwargs):
-        crawler = AsyncCrawler(*parser_registry)
+        data = self.decode_request()
+
         try:
-            parsers = crawler.crawl()
-        except ClientConnectionError:
-            messages.error(request, 'Не удалось обновить списки. Попробуйте повторить позже.')
-        else:
-            update_records(parsers)
-            self.update_checksum(parsers)
-            cache.get_or_set('initialized', True)
+            field = data['field']
+            student_ids = [int(student_id) for student_id in data['student_ids']]
+            value = data.get('value')
+        except (TypeError, KeyError, ValueError):
+            return HttpResponse(status=400)
+
+        if field not in STUDENT_FLAGS or value not in (None, True, False) or not isinstance(data['student_ids'], list):
+            return HttpResponse(status=400)
+
+        states = {}
+        for batch in batches(student_ids, BATCH_SIZE):
+            states.update(update_flag(field, batch, value))
+
+        if states:
+            bump_data_version()
+        return JsonResponse({'field': field, 'students': states})
+
+
+class UpdateView(View):
+
+    def post(self, request, *args, **kwargs):
+        job = enqueue_crawl()
+
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse(job.to_dict(), status=202)
 
         return redirect('abitur')
 
-    @staticmethod
-    def update_checksum(parsers):
-        checksum_string = ''.join([make_checksum(parser.source_url) for parser in parsers])
-        cache.set('checksum', checksum_string)
+
+class UpdateStatusView(View):
+
+    def get(self, request, *args, **kwargs):
+        job = CrawlJob.objects.filter(attempt=0).first()
+
+        if not job:
+            return JsonResponse({'status': None})
+
+        return JsonResponse(job.to_dict())
 
 
 class AbiturView(View):
     template_name = 'abitur.html'
+    table_template_name = 'abitur/student_table.html'
     alert_text_ok = 'Обновление не требуется'
     alert_class_ok = 'alert-success'
     alert_text_warning = 'Пора обновить'
@@ -100,60 +139,88 @@ class AbiturView(View):
         if not initialized:
             ctx = {
                 'form': form,
+                'table': render_to_string(self.table_template_name),
                 'alert_text': self.alert_text_warning,
                 'alert_class': self.alert_class_warning
             }
         else:
             ctx = self.get_context(form)
 
+        ctx['active_job'] = get_active_job()
+
         return render(request, 'abitur/abitur.html', ctx)
 
     def get_context(self, form):
         period = form.get_period()
-
-        students = Student.objects.select_related('school').all()
-        students_filtered = students.filter(period)
         alert_text, alert_class = self.check_sources()
 
         ctx = {
             'form': form,
-            'students': students_filtered,
-            'sech_count': sech_count(students),
-            'pirogova_count': pirogova_count(students),
-            'sech_bvi_count': sech_bvi_count(students),
-            'pirogova_bvi_count': pirogova_bvi_count(students),
-            'total_count': students.count(),
-            'sech_funded_only_count': sech_funded_only_count(students),
-            'pirogova_funded_only_count': pirogova_funded_only_count(students),
-            'pirogova_winners_count': pirogova_winners_count(students),
-            'sechenova_winners_count': sechenova_winners_count(students),
+            'table': get_cached(('table', period), lambda: self.render_table(period)),
             'alert_text': alert_text,
             'alert_class': alert_class,
         }
 
         return ctx
 
+    def render_table(self, period):
+        students = Student.objects.select_related('school').all()
+        students_filtered, next_cursor = students_page(students.filter(period), size=settings.STUDENTS_PAGE_SIZE)
+
+        return render_to_string(self.table_template_name, {
+            'students': students_filtered,
+            'next_cursor': next_cursor,
+            'overlapping': overlapping_names(students_filtered),
+            'overlap_count': Overlap.objects.count(),
+            **student_counts(students),
+        })
+
     def check_sources(self):
-        checksum = self.total_checksum()
+        sources = get_sources()
+
+        if not sources or not sources['ok']:
+            return self.alert_text_error, self.alert_class_error
 
-        if checksum is None:
+        if timezone.now() - sources['checked_at'] > timedelta(seconds=settings.SOURCES_MAX_AGE):
             return self.alert_text_error, self.alert_class_error
 
-        cached_checksum = cache.get('checksum')
+        if sources['changed']:
+            return self.alert_text_warning, self.alert_class_warning
+        return self.alert_text_ok, self.alert_class_ok
 
-        if cached_checksum:
-            if cached_checksum != checksum:
-                return self.alert_text_warning, self.alert_class_warning
-            return self.alert_text_ok, self.alert_class_ok
 
-    @staticmethod
-    def total_checksum():
-        crawler = AsyncCrawler(*parser_registry)
+class StudentsView(View):
+
+    def get(self, request, *args, **kwargs):
+        form = PeriodFilterForm(request.GET)
+        period = form.get_period()
+        cursor = request.GET.get('cursor')
+
         try:
-            sources = crawler.get_sources()
-        except ClientConnectionError:
-            return None
-        return ''.join([make_checksum(link) for link in sources])
+            offset = int(request.GET.get('offset', 0))
+            page = get_cached(('page', period, cursor, offset), lambda: self.get_page(period, cursor, offset))
+        except ValueError:
+            return JsonResponse({'error': 'Неверный запрос'}, status=400)
+
+        return JsonResponse(page)
+
+    @staticmethod
+    def get_page(period, cursor, offset):
+        students = Student.objects.select_related('school').filter(period)
+        students, next_cursor = students_page(students, cursor, size=settings.STUDENTS_PAGE_SIZE)
+        html = render_to_string('abitur/student_rows.html', {
+            'students': students,
+            'offset': offset,
+            'overlapping': overlapping_names(students),
+        })
+
+        return {'html': html, 'next': next_cursor}
+
+
+class HistoryView(View):
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(get_cached(('history',), snapshot_series))
 
 
 class HomeView(RedirectView):
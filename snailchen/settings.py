@@ -122,14 +122,104 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The default cache is a local SQLite file shared by the web, worker and
+# poller processes; the database cache is used if the file is not usable.
+
+CACHE_FILE = os.getenv('CACHE_FILE', os.path.join(BASE_DIR, 'cache', 'cache.sqlite3'))
+
 CACHES = {
     'default': {
+        'BACKEND': 'abitur.cache_backends.SQLiteCache',
+        'LOCATION': CACHE_FILE,
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+            'FALLBACK': 'db',
+        }
+    },
+    'db': {
         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
         'LOCATION': 'snailchencache',
         'TIMEOUT': None
     }
 }
 
+# Freshness of the university pages is checked by `manage.py poll_sources`
+# in the background; results older than SOURCES_MAX_AGE are shown as unknown.
+
+SOURCES_POLL_INTERVAL = int(os.getenv('SOURCES_POLL_INTERVAL', 600))
+
+SOURCES_MAX_AGE = SOURCES_POLL_INTERVAL * 3
+
+# Downloaded applicant lists and the tables extracted from each of their pages.
+
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', os.path.join(BASE_DIR, 'pdf_cache'))
+
+# Extracted pages that no crawl has read for this many seconds are removed
+# whenever a new PDF is downloaded.
+
+PDF_CACHE_MAX_AGE = int(os.getenv('PDF_CACHE_MAX_AGE', 7 * 24 * 60 * 60))
+
+# Uncached documents are split into page ranges of this size and extracted
+# in parallel by the crawler's process pool.
+
+CRAWLER_PAGES_PER_TASK = int(os.getenv('CRAWLER_PAGES_PER_TASK', 2))
+
+# Long-lived process pool shared by all crawls of a worker; it is replaced
+# after every process has run CRAWLER_MAX_TASKS_PER_CHILD tasks on average.
+
+CRAWLER_WORKERS = int(os.getenv('CRAWLER_WORKERS', os.cpu_count() or 1))
+
+CRAWLER_MAX_TASKS_PER_CHILD = int(os.getenv('CRAWLER_MAX_TASKS_PER_CHILD', 50))
+
+# One pooled HTTP client per process is shared by all crawls and checks.
+
+HTTP_CONNECTIONS = int(os.getenv('HTTP_CONNECTIONS', 20))
+
+HTTP_CONNECTIONS_PER_HOST = int(os.getenv('HTTP_CONNECTIONS_PER_HOST', 4))
+
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', 600))
+
+HTTP_KEEPALIVE_TIMEOUT = int(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 60))
+
+HTTP_TIMEOUT = int(os.getenv('HTTP_TIMEOUT', 30))
+
+# Rows of the extracted tables are cleaned and split into categories row by row;
+# set to 1 to use pandas column operations instead, which only pay off on lists
+# far longer than the real ones (see benchmark_parsers).
+PARSE_VECTORIZED = bool(int(os.getenv('PARSE_VECTORIZED', 0)))
+
+# Sources checked and crawled at the same time; the sources themselves are
+# ParserSpec rows, edited in the admin.
+CRAWL_CONCURRENCY = int(os.getenv('CRAWL_CONCURRENCY', 8))
+
+# Network errors and timeouts of a source are retried with exponential backoff
+# and jitter. Sources that still fail don't stop the others: what was parsed is
+# ingested and the failed sources are crawled again by background jobs.
+CRAWL_RETRIES = int(os.getenv('CRAWL_RETRIES', 3))
+
+CRAWL_RETRY_BACKOFF = float(os.getenv('CRAWL_RETRY_BACKOFF', 1))
+
+CRAWL_SOURCE_TIMEOUT = int(os.getenv('CRAWL_SOURCE_TIMEOUT', 600))
+
+CRAWL_JOB_RETRIES = int(os.getenv('CRAWL_JOB_RETRIES', 3))
+
+CRAWL_JOB_RETRY_DELAY = int(os.getenv('CRAWL_JOB_RETRY_DELAY', 60))
+
+# Every crawl stores per-stage timings; with CRAWL_PROFILE_DIR set, the
+# synchronous stages and each extraction task also dump cProfile stats there.
+
+CRAWL_PROFILE_DIR = os.getenv('CRAWL_PROFILE_DIR', '')
+
+# Rows of the student table rendered at once; the rest is loaded by cursor.
+
+STUDENTS_PAGE_SIZE = int(os.getenv('STUDENTS_PAGE_SIZE', 100))
+
+# Rendered student tables are cached per period and data version, which is
+# bumped on every ingest and mark toggle; old versions simply expire.
+
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv('FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24))
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.0/topics/i18n/
 
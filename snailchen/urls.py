@@ -16,13 +16,20 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
-from abitur.views import AbiturView, UpdateView, AjaxCheckedView, AjaxWinnerView, HomeView
+from abitur.views import (
+    AbiturView, StudentsView, UpdateView, UpdateStatusView, AjaxCheckedView, AjaxWinnerView,
+    AjaxBatchMarkView, HistoryView, HomeView
+)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('update/', UpdateView.as_view(), name='update'),
+    path('update/status/', UpdateStatusView.as_view(), name='update-status'),
     path('abitur/', AbiturView.as_view(), name='abitur'),
+    path('abitur/students/', StudentsView.as_view(), name='students'),
+    path('abitur/history/', HistoryView.as_view(), name='history'),
     path('olympics-checked/', AjaxCheckedView.as_view(), name='check-student'),
     path('olympics-winner/', AjaxWinnerView.as_view(), name='olympics-winner'),
+    path('olympics-batch/', AjaxBatchMarkView.as_view(), name='olympics-batch'),
     path('', HomeView.as_view(), name='home')
 ]